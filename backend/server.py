@@ -1,22 +1,74 @@
+import time
+IMPORT_STARTED_AT = time.perf_counter()
+
 import os
+import re
 import asyncio
+import gzip
+import hashlib
+import heapq
+import math
+import mimetypes
+import threading
 import uuid
 import json
-from datetime import datetime
-from typing import List, Optional, Dict, Any
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Awaitable, Callable, List, Optional, Dict, Any, Tuple
 
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
+from starlette.requests import HTTPConnection
 from pydantic import BaseModel, Field
-from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+import orjson
 from dotenv import load_dotenv
-import requests
-from emergentintegrations.llm.chat import LlmChat, UserMessage
+
+# motor, requests and emergentintegrations are imported on first use to keep cold starts fast
+if TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+    import requests
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
 
 load_dotenv()
 
-app = FastAPI(title="Poppy - AI Entertainment Discovery")
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered with orjson; values such as ObjectId fall back to str"""
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return orjson.dumps(content, default=str)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the Mongo client at startup and warm pools and caches in the background"""
+    global client, db
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    client = AsyncIOMotorClient(MONGO_URL, maxPoolSize=MONGO_POOL_SIZE)
+    db = client[DB_NAME]
+    background_tasks = [asyncio.create_task(run_warmup())]
+    background_tasks += [asyncio.create_task(job_worker()) for _ in range(JOB_WORKERS)]
+    background_tasks.append(asyncio.create_task(job_heartbeat_loop()))
+    background_tasks.append(asyncio.create_task(upstream_health_loop()))
+    if CACHE_L2_ENABLED:
+        background_tasks.append(asyncio.create_task(cache_invalidation_loop()))
+    if PREFETCH_ENABLED:
+        background_tasks.append(asyncio.create_task(prefetch_loop()))
+    if ARCHIVE_ENABLED:
+        background_tasks.append(asyncio.create_task(archive_loop()))
+    yield
+    for task in background_tasks:
+        task.cancel()
+    client.close()
+
+app = FastAPI(title="Poppy - AI Entertainment Discovery", default_response_class=FastJSONResponse, lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -37,14 +89,321 @@ RAPIDAPI_KEY = os.getenv("RAPIDAPI_KEY")
 RAPIDAPI_HOST = os.getenv("RAPIDAPI_HOST")
 TMDB_API_KEY = os.getenv("TMDB_API_KEY")
 
-# MongoDB client
-client = AsyncIOMotorClient(MONGO_URL)
-db: AsyncIOMotorDatabase = client[DB_NAME]
+# Streaming availability settings
+DEFAULT_COUNTRY = os.getenv("DEFAULT_COUNTRY", "us").lower()
+COUNTRY_HEADERS = ["X-Country", "CF-IPCountry", "CloudFront-Viewer-Country"]
+COUNTRY_PATTERN = re.compile(r"^[a-z]{2}$")
+STREAMING_RULES_PATH = os.getenv("STREAMING_RULES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "streaming_rules.json"))
+STREAMING_RULES_CHECK_INTERVAL = float(os.getenv("STREAMING_RULES_CHECK_INTERVAL", "5"))
+
+# TMDB settings
+TMDB_API_BASE_URL = "https://api.themoviedb.org/3"
+
+# Image proxy settings
+TMDB_IMAGE_BASE_URL = "https://image.tmdb.org/t/p"
+PUBLIC_API_URL = os.getenv("PUBLIC_API_URL", "").rstrip("/")
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "image_cache"))
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+POSTER_SIZES = os.getenv("POSTER_SIZES", "w185,w342,w500").split(",")
+BACKDROP_SIZES = os.getenv("BACKDROP_SIZES", "w300,w780,w1280").split(",")
+IMAGE_SIZES = set(POSTER_SIZES + BACKDROP_SIZES)
+IMAGE_PATH_PATTERN = re.compile(r"^[A-Za-z0-9_-]+\.(jpg|jpeg|png|svg|webp)$")
+
+# Response compression settings
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+
+# Connection pool settings
+MONGO_POOL_SIZE = int(os.getenv("MONGO_POOL_SIZE", "50"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+
+# Metadata cache settings
+TMDB_CACHE_TTL = int(os.getenv("TMDB_CACHE_TTL", str(24 * 3600)))
+STREAMING_CACHE_TTL = int(os.getenv("STREAMING_CACHE_TTL", str(6 * 3600)))
+STREAMING_PARTIAL_CACHE_TTL = int(os.getenv("STREAMING_PARTIAL_CACHE_TTL", "300"))
+METADATA_CACHE_MAX_ENTRIES = int(os.getenv("METADATA_CACHE_MAX_ENTRIES", "5000"))
+
+# Warm-up settings
+WARMUP_TOP_TITLES = int(os.getenv("WARMUP_TOP_TITLES", "10"))
+WARMUP_HISTORY_DAYS = int(os.getenv("WARMUP_HISTORY_DAYS", "7"))
+WARMUP_STEP_TIMEOUT = float(os.getenv("WARMUP_STEP_TIMEOUT", "20"))
+WARMUP_LLM_PING = os.getenv("WARMUP_LLM_PING", "true").lower() == "true"
+
+# LLM prompt settings
+LLM_MODEL = os.getenv("LLM_MODEL", "gemini-2.0-flash")
+LLM_MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", "512"))
+RECOMMENDATION_SYSTEM_PROMPT = (
+    "You are Poppy, an empathetic movie and TV curator. Read the user's mood and pick 5 titles "
+    "that fit its tone, pacing and themes.\n"
+    "Reply with JSON only, no prose or code fences:\n"
+    '{"mood_interpretation":"<1 sentence>","recommendations":'
+    '[{"title":"<exact title>","type":"movie|tv","reason":"<1 sentence>"}]}'
+)
+
+# LLM router settings; backends are provider:model pairs tried in order, "stub:<delay>" runs locally
+LLM_BACKENDS = [spec.strip() for spec in os.getenv("LLM_BACKENDS", f"gemini:{LLM_MODEL}").split(",") if spec.strip()]
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "2.0"))
+LLM_HEDGE_MIN = float(os.getenv("LLM_HEDGE_MIN", "0.3"))
+LLM_HEDGE_MAX = float(os.getenv("LLM_HEDGE_MAX", "8.0"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+
+# LLM admission control settings
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))
+LLM_PRIORITIES = {"interactive": 0, "remix": 1, "batch": 2}
+
+# Conversational WebSocket session settings
+CHAT_SESSION_TTL = int(os.getenv("CHAT_SESSION_TTL", "1800"))
+MAX_CHAT_SESSIONS = int(os.getenv("MAX_CHAT_SESSIONS", "500"))
+CHAT_SESSION_MAX_TURNS = int(os.getenv("CHAT_SESSION_MAX_TURNS", "20"))
+
+# Async recommendation job settings
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+JOB_TTL = int(os.getenv("JOB_TTL", "3600"))
+JOB_LONG_POLL_MAX = float(os.getenv("JOB_LONG_POLL_MAX", "30"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "10"))
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", "60"))
+
+# Per-user seen-titles filter settings
+SEEN_FILTER_CAPACITY = int(os.getenv("SEEN_FILTER_CAPACITY", "1000"))  # titles per generation, about 100 sessions
+SEEN_FILTER_ERROR_RATE = float(os.getenv("SEEN_FILTER_ERROR_RATE", "0.01"))  # false positives per full generation
+SEEN_PROMPT_TITLES = int(os.getenv("SEEN_PROMPT_TITLES", "10"))
+
+# Offline catalog and upstream health settings
+CATALOG_SNAPSHOT_PATH = os.getenv("CATALOG_SNAPSHOT_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalog_snapshot.json"))
+UPSTREAM_FAILURE_THRESHOLD = int(os.getenv("UPSTREAM_FAILURE_THRESHOLD", "3"))
+UPSTREAM_COOLDOWN = int(os.getenv("UPSTREAM_COOLDOWN", "60"))
+UPSTREAM_CHECK_INTERVAL = int(os.getenv("UPSTREAM_CHECK_INTERVAL", "30"))
+
+# Trending-title prefetcher settings
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "true").lower() == "true"
+PREFETCH_INTERVAL = int(os.getenv("PREFETCH_INTERVAL", "600"))
+PREFETCH_HISTORY_HOURS = int(os.getenv("PREFETCH_HISTORY_HOURS", "24"))
+PREFETCH_TOP_TITLES = int(os.getenv("PREFETCH_TOP_TITLES", "50"))
+PREFETCH_CALL_BUDGET = int(os.getenv("PREFETCH_CALL_BUDGET", "60"))
+PREFETCH_REFRESH_WINDOW = int(os.getenv("PREFETCH_REFRESH_WINDOW", "1800"))
+
+# Retention and archive settings (0 days keeps data forever)
+SESSION_RETENTION_DAYS = int(os.getenv("SESSION_RETENTION_DAYS", "90"))
+FEEDBACK_RETENTION_DAYS = int(os.getenv("FEEDBACK_RETENTION_DAYS", "365"))
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "true").lower() == "true"
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "archive"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "5000"))
+ARCHIVE_INTERVAL = int(os.getenv("ARCHIVE_INTERVAL", "3600"))
+
+# Worker and shared cache settings
+WEB_CONCURRENCY = os.getenv("WEB_CONCURRENCY", "1").lower()  # a worker count, or "auto" for one per CPU core
+# Worker processes inherit WEB_CONCURRENCY, so each one knows how many siblings share the limits below
+SERVER_WORKERS = (os.cpu_count() or 1) if WEB_CONCURRENCY == "auto" else max(1, int(WEB_CONCURRENCY))
+WORKER_ID = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+CACHE_L2_ENABLED = os.getenv("CACHE_L2_ENABLED", "true").lower() == "true"
+CACHE_INVALIDATION_INTERVAL = float(os.getenv("CACHE_INVALIDATION_INTERVAL", "2"))
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", "900"))
+
+# MongoDB client, opened in the lifespan handler
+client: Optional["AsyncIOMotorClient"] = None
+db: Optional["AsyncIOMotorDatabase"] = None
+
+# Shared pooled HTTP session, created on first use
+_http_session: Optional["requests.Session"] = None
+
+def get_http_session() -> "requests.Session":
+    """Return the shared HTTP session so upstream calls reuse pooled TLS connections"""
+    global _http_session
+    if _http_session is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=10, pool_maxsize=HTTP_POOL_SIZE)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _http_session = session
+    return _http_session
+
+class TTLCache:
+    """In-memory LRU cache whose entries expire after a fixed time-to-live"""
+
+    def __init__(self, ttl: int, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Any) -> Any:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def ttl_remaining(self, key: Any) -> float:
+        """Seconds until the entry expires, or 0 when it is missing or already expired"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return 0
+        return max(0, entry[0] - time.monotonic())
+
+    def set(self, key: Any, value: Any, ttl: Optional[float] = None):
+        self.entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def pop(self, key: Any):
+        self.entries.pop(key, None)
+
+class TieredCache:
+    """In-process TTLCache (L1) in front of a Mongo collection shared by every worker (L2)"""
+
+    def __init__(self, namespace: str, ttl: int, max_entries: int):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.l1 = TTLCache(ttl, max_entries)
+        self.stats = {"l1_hits": 0, "l2_hits": 0, "misses": 0, "l2_errors": 0}
+        tiered_caches[namespace] = self
+
+    def _l2_id(self, key: Any) -> str:
+        # Tuple keys serialize as JSON arrays
+        return f"{self.namespace}:{orjson.dumps(key).decode()}"
+
+    async def get(self, key: Any) -> Any:
+        value = self.l1.get(key)
+        if value is not None:
+            self.stats["l1_hits"] += 1
+            return value
+        
+        if CACHE_L2_ENABLED and db is not None:
+            try:
+                doc = await db.cache_entries.find_one({"_id": self._l2_id(key), "expires_at": {"$gt": datetime.utcnow()}})
+            except Exception as e:
+                self.stats["l2_errors"] += 1
+                print(f"Shared cache read error ({self.namespace}): {e}")
+                doc = None
+            if doc:
+                value = orjson.loads(doc["value"])
+                # L1 keeps the entry only as long as the shared copy lives
+                self.l1.set(key, value, ttl=(doc["expires_at"] - datetime.utcnow()).total_seconds())
+                self.stats["l2_hits"] += 1
+                return value
+        
+        self.stats["misses"] += 1
+        return None
+
+    async def ttl_remaining(self, key: Any) -> float:
+        """Seconds until the shared entry expires, falling back to L1 when L2 is off"""
+        if not (CACHE_L2_ENABLED and db is not None):
+            return self.l1.ttl_remaining(key)
+        try:
+            doc = await db.cache_entries.find_one({"_id": self._l2_id(key)}, projection={"expires_at": 1})
+        except Exception:
+            return self.l1.ttl_remaining(key)
+        return max(0, (doc["expires_at"] - datetime.utcnow()).total_seconds()) if doc else 0
+
+    async def set(self, key: Any, value: Any, publish: bool = False, ttl: Optional[float] = None):
+        """Store in both tiers; publish when replacing a value other workers may hold in L1"""
+        ttl = self.ttl if ttl is None else ttl
+        self.l1.set(key, value, ttl=ttl)
+        if not (CACHE_L2_ENABLED and db is not None):
+            return
+        try:
+            await db.cache_entries.replace_one(
+                {"_id": self._l2_id(key)},
+                {"value": orjson.dumps(value), "expires_at": datetime.utcnow() + timedelta(seconds=ttl)},
+                upsert=True
+            )
+            if publish:
+                await publish_cache_invalidation(self.namespace, key)
+        except Exception as e:
+            self.stats["l2_errors"] += 1
+            print(f"Shared cache write error ({self.namespace}): {e}")
+
+    async def invalidate(self, key: Any):
+        self.l1.pop(key)
+        if CACHE_L2_ENABLED and db is not None:
+            await db.cache_entries.delete_one({"_id": self._l2_id(key)})
+            await publish_cache_invalidation(self.namespace, key)
+
+    def metrics(self) -> Dict[str, Any]:
+        lookups = self.stats["l1_hits"] + self.stats["l2_hits"] + self.stats["misses"]
+        l2_lookups = self.stats["l2_hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "l1_entries": len(self.l1.entries),
+            "l1_hit_rate": round(self.stats["l1_hits"] / lookups, 3) if lookups else 0.0,
+            # Share of L1 misses answered by the shared tier
+            "l2_hit_rate": round(self.stats["l2_hits"] / l2_lookups, 3) if l2_lookups else 0.0,
+            "hit_rate": round((lookups - self.stats["misses"]) / lookups, 3) if lookups else 0.0
+        }
+
+async def publish_cache_invalidation(namespace: str, key: Any):
+    """Tell other workers to drop their L1 copy of a key"""
+    await db.cache_invalidations.insert_one({
+        "namespace": namespace,
+        "key": orjson.dumps(key).decode(),
+        "origin": WORKER_ID,
+        "created_at": datetime.utcnow()
+    })
+
+async def cache_invalidation_loop():
+    """Poll the shared invalidation log and evict matching L1 entries published by other workers"""
+    since = datetime.utcnow()
+    while True:
+        await asyncio.sleep(CACHE_INVALIDATION_INTERVAL)
+        polled_at = datetime.utcnow()
+        try:
+            # Overlap polls by one interval so late inserts are not missed; evicting twice is harmless
+            async for doc in db.cache_invalidations.find({
+                "created_at": {"$gte": since - timedelta(seconds=CACHE_INVALIDATION_INTERVAL)},
+                "origin": {"$ne": WORKER_ID}
+            }):
+                cache = tiered_caches.get(doc["namespace"])
+                if cache:
+                    key = orjson.loads(doc["key"])
+                    cache.l1.pop(tuple(key) if isinstance(key, list) else key)
+            since = polled_at
+        except Exception as e:
+            print(f"Cache invalidation poll error: {e}")
+
+def normalize_title(title: str) -> str:
+    """Title key shared by the metadata caches, the catalog and the seen filter: LLM and TMDB spellings agree"""
+    return " ".join(re.sub(r"[^\w\s]", " ", title.lower()).split())
+
+tiered_caches: Dict[str, TieredCache] = {}
+tmdb_cache = TieredCache("tmdb", TMDB_CACHE_TTL, METADATA_CACHE_MAX_ENTRIES)
+streaming_cache = TieredCache("streaming", STREAMING_CACHE_TTL, METADATA_CACHE_MAX_ENTRIES)
+tmdb_details_cache = TieredCache("tmdb_details", TMDB_CACHE_TTL, METADATA_CACHE_MAX_ENTRIES)
+llm_result_cache = TieredCache("llm", LLM_CACHE_TTL, METADATA_CACHE_MAX_ENTRIES)
+
+# Live chat sessions for /api/ws/session; the TTL is refreshed on every turn so idle sessions expire
+chat_sessions = TTLCache(CHAT_SESSION_TTL, MAX_CHAT_SESSIONS)
+
+# Queue of job ids waiting for a recommendation job worker
+job_queue: "asyncio.Queue[str]" = asyncio.Queue(maxsize=JOB_QUEUE_SIZE)
+
+# Running totals of LLM token usage, latency and parse outcomes for /api/metrics
+llm_usage_stats: Dict[str, Any] = {
+    "requests": 0,
+    "prompt_tokens": 0,
+    "completion_tokens": 0,
+    "total_latency_ms": 0.0,
+    "parse": {"json": 0, "recovered": 0, "fallback": 0}
+}
+
+# Readiness state filled in by the warm-up phase
+warmup_state: Dict[str, Any] = {"ready": False, "checks": {}, "duration_ms": None}
+archive_state: Dict[str, Any] = {"last_run": None, "rows_exported": {}, "rows_rejected": {}, "error": None}
 
 # Pydantic models
 class MoodQuery(BaseModel):
     mood: str = Field(..., description="User's mood or vibe description")
     user_id: Optional[str] = Field(None, description="Optional user ID for personalization")
+    country: Optional[str] = Field(None, description="ISO 3166-1 alpha-2 country for streaming availability")
+    priority: str = Field("interactive", description="Scheduling class for the LLM stage: interactive, remix or batch")
 
 class Recommendation(BaseModel):
     id: str
@@ -55,7 +414,10 @@ class Recommendation(BaseModel):
     rating: float
     poster_url: Optional[str]
     backdrop_url: Optional[str]
-    trailer_url: Optional[str]
+    poster_srcset: Optional[str] = None
+    backdrop_srcset: Optional[str] = None
+    trailer_url: Optional[str] = None
+    details_url: Optional[str] = None
     streaming_availability: List[Dict[str, Any]] = []
     recommendation_reason: str
 
@@ -63,35 +425,286 @@ class RecommendationResponse(BaseModel):
     recommendations: List[Recommendation]
     mood_interpretation: str
     session_id: str
+    degraded: bool = False
+
+# Admission control for LLM-bound work
+class AdmissionRejected(Exception):
+    """Raised when the LLM wait queue is full"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"LLM queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+class AdmissionController:
+    """Bounded concurrency pool with a bounded priority wait queue in front of the LLM"""
+
+    def __init__(self, max_concurrency: int, max_queue: int):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.active = 0
+        self.waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self.sequence = 0
+        self.avg_service_seconds = 3.0
+        self.stats: Dict[str, Dict[str, float]] = {
+            name: {"admitted": 0, "rejected": 0, "queued": 0, "total_wait_ms": 0.0, "max_wait_ms": 0.0}
+            for name in LLM_PRIORITIES
+        }
+
+    def queue_depth(self) -> int:
+        return sum(1 for _, _, future in self.waiters if not future.done())
+
+    def retry_after(self) -> int:
+        """Estimate seconds until a slot frees up from the queue length and average LLM latency"""
+        rounds = (self.queue_depth() + 1) / self.max_concurrency
+        return max(1, math.ceil(rounds * self.avg_service_seconds))
+
+    async def acquire(self, priority: str):
+        stats = self.stats[priority]
+        if self.active < self.max_concurrency and not self.queue_depth():
+            self.active += 1
+            stats["admitted"] += 1
+            return 0.0
+
+        if self.queue_depth() >= self.max_queue:
+            stats["rejected"] += 1
+            raise AdmissionRejected(self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        self.sequence += 1
+        heapq.heappush(self.waiters, (LLM_PRIORITIES[priority], self.sequence, future))
+        stats["queued"] += 1
+        started = time.perf_counter()
+        try:
+            await future
+        except asyncio.CancelledError:
+            # A slot handed over just before cancellation must be passed on
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+        wait_ms = (time.perf_counter() - started) * 1000
+        stats["admitted"] += 1
+        stats["total_wait_ms"] += wait_ms
+        stats["max_wait_ms"] = max(stats["max_wait_ms"], wait_ms)
+        return wait_ms
+
+    def try_acquire(self) -> bool:
+        """Take a slot only if one is free right now, never queueing; used for hedged LLM attempts"""
+        if self.active < self.max_concurrency and not self.queue_depth():
+            self.active += 1
+            return True
+        return False
+
+    def release(self):
+        self.active -= 1
+        while self.waiters:
+            _, _, future = heapq.heappop(self.waiters)
+            if not future.done():
+                self.active += 1
+                future.set_result(None)
+                break
+
+    @asynccontextmanager
+    async def slot(self, priority: str = "interactive"):
+        """Hold one LLM slot for the duration of the block"""
+        await self.acquire(priority)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            # Exponentially weighted average of LLM latency drives Retry-After
+            self.avg_service_seconds = 0.8 * self.avg_service_seconds + 0.2 * (time.perf_counter() - started)
+            self.release()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": self.queue_depth(),
+            "max_queue": self.max_queue,
+            "avg_service_seconds": round(self.avg_service_seconds, 3),
+            "priorities": {
+                name: {
+                    **{key: round(value, 1) for key, value in stats.items()},
+                    "avg_wait_ms": round(stats["total_wait_ms"] / stats["queued"], 1) if stats["queued"] else 0.0
+                }
+                for name, stats in self.stats.items()
+            }
+        }
+
+# LLM_MAX_CONCURRENCY and LLM_MAX_QUEUE are server-wide, so each worker admits its share, rounded up
+llm_admission = AdmissionController(-(-LLM_MAX_CONCURRENCY // SERVER_WORKERS), -(-LLM_MAX_QUEUE // SERVER_WORKERS))
 
 # LLM Chat instance
-async def get_recommendation_chat(session_id: str):
+async def get_recommendation_chat(session_id: str, provider: str = "gemini", model: Optional[str] = None):
     """Create a new LLM chat instance for recommendations"""
+    from emergentintegrations.llm.chat import LlmChat
+
+    api_key = GEMINI_API_KEY if provider == "gemini" else os.getenv(f"{provider.upper()}_API_KEY")
     return LlmChat(
-        api_key=GEMINI_API_KEY,
+        api_key=api_key,
         session_id=session_id,
-        system_message="""You are Poppy, an expert entertainment curator who understands user moods and vibes to provide personalized movie and TV show recommendations. 
-
-When users describe their mood, vibe, or situation (like 'cozy rainy evening', 'action-packed weekend', 'need something to cry to', 'fun family night'), you should:
-
-1. Interpret their emotional state and context
-2. Provide 5 specific movie/TV recommendations that match their vibe
-3. For each recommendation, explain briefly why it matches their mood
-
-Your response should be in this exact JSON format:
-{
-  "mood_interpretation": "Brief interpretation of the user's mood and what they're looking for",
-  "recommendations": [
-    {
-      "title": "Movie/Show Title",
-      "type": "movie" or "tv",
-      "reason": "Why this matches their vibe in 1-2 sentences"
-    }
-  ]
-}
+        system_message=RECOMMENDATION_SYSTEM_PROMPT
+    ).with_model(provider, model or LLM_MODEL).with_max_tokens(LLM_MAX_TOKENS)
+
+# LLM backends and hedging router
+class EmergentLlmBackend:
+    """Backend that sends each prompt to a provider model through a fresh LlmChat"""
+
+    def __init__(self, provider: str, model: str):
+        self.provider = provider
+        self.model = model
+        self.name = f"{provider}:{model}"
+
+    async def complete(self, session_id: str, prompt: str) -> str:
+        chat = await self.open_chat(session_id)
+        return await self.send(chat, prompt)
 
-Be creative, empathetic, and focus on the emotional connection between the user's mood and the content. Consider factors like pacing, tone, themes, and overall feeling of the content."""
-    ).with_model("gemini", "gemini-2.0-flash").with_max_tokens(2048)
+    async def open_chat(self, session_id: str):
+        """Start a multi-turn chat; LlmChat keeps the history itself"""
+        return await get_recommendation_chat(session_id, self.provider, self.model)
+
+    async def send(self, chat, prompt: str) -> str:
+        from emergentintegrations.llm.chat import UserMessage
+
+        return await chat.send_message(UserMessage(text=prompt))
+
+class StubLlmBackend:
+    """Local backend that answers with a fixed reply after a delay, for tests and offline development"""
+
+    def __init__(self, name: str = "stub", delay: float = 0.0, reply: Optional[str] = None):
+        self.name = name
+        self.delay = delay
+        self.reply = reply
+
+    async def complete(self, session_id: str, prompt: str) -> str:
+        await asyncio.sleep(self.delay)
+        if self.reply is not None:
+            return self.reply
+        return json.dumps({**fallback_recommendations(prompt), "mood_interpretation": f"Stub picks for '{prompt}'"})
+
+    async def open_chat(self, session_id: str):
+        # The stub has no context to keep, so its chat is just the prompt history
+        return []
+
+    async def send(self, chat, prompt: str) -> str:
+        chat.append(prompt)
+        return await self.complete("", prompt)
+
+def build_llm_backend(spec: str):
+    """Build a backend from a 'provider:model' spec such as 'gemini:gemini-2.0-flash' or 'stub:0.5'"""
+    provider, _, model = spec.partition(":")
+    if provider == "stub":
+        return StubLlmBackend(spec, float(model or 0))
+    return EmergentLlmBackend(provider, model or LLM_MODEL)
+
+class LlmRouter:
+    """Send a prompt to the primary backend, hedge to the next after a delay, keep the first valid reply"""
+
+    def __init__(self, backends: List[Any], admission: Optional[AdmissionController] = None):
+        self.backends = backends
+        # The caller holds one admission slot; a hedge running alongside another attempt needs its own
+        self.admission = admission
+        self.stats: Dict[str, Dict[str, Any]] = {
+            backend.name: {"requests": 0, "valid": 0, "invalid": 0, "errors": 0, "cancelled": 0, "wins": 0, "latencies": deque(maxlen=200)}
+            for backend in backends
+        }
+
+    def hedge_delay(self) -> float:
+        """p95 latency of the primary's valid replies, shortened when the primary often fails"""
+        stats = self.stats[self.backends[0].name]
+        latencies = sorted(stats["latencies"])
+        delay = latencies[int(0.95 * (len(latencies) - 1))] if len(latencies) >= LLM_HEDGE_MIN_SAMPLES else LLM_HEDGE_DELAY
+        attempts = stats["valid"] + stats["invalid"] + stats["errors"]
+        if attempts >= LLM_HEDGE_MIN_SAMPLES:
+            delay *= stats["valid"] / attempts
+        return min(LLM_HEDGE_MAX, max(LLM_HEDGE_MIN, delay))
+
+    async def _attempt(self, backend, session_id: str, prompt: str, mood: str) -> Optional[Dict[str, Any]]:
+        stats = self.stats[backend.name]
+        stats["requests"] += 1
+        started = time.perf_counter()
+        try:
+            reply = await backend.complete(f"{session_id}-{backend.name}", prompt)
+        except asyncio.CancelledError:
+            stats["cancelled"] += 1
+            raise
+        except Exception as e:
+            print(f"LLM backend {backend.name} error: {e}")
+            stats["errors"] += 1
+            return None
+
+        latency = time.perf_counter() - started
+        llm_data, parse_mode = parse_llm_recommendations(reply, mood)
+        if parse_mode == "fallback":
+            stats["invalid"] += 1
+            return None
+        stats["valid"] += 1
+        stats["latencies"].append(latency)
+        return {"reply": reply, "llm_data": llm_data, "parse": parse_mode, "backend": backend.name}
+
+    async def route(self, session_id: str, prompt: str, mood: str) -> Dict[str, Any]:
+        pending: Dict[asyncio.Task, Any] = {}
+        slot_holders = set()
+        backups = list(self.backends[1:])
+        hedged = False
+
+        def launch(backend):
+            task = asyncio.create_task(self._attempt(backend, session_id, prompt, mood))
+            pending[task] = backend
+            return task
+
+        def finish(task):
+            pending.pop(task)
+            if task in slot_holders:
+                slot_holders.discard(task)
+                self.admission.release()
+
+        launch(self.backends[0])
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, timeout=self.hedge_delay() if backups else None, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Hedge delay elapsed without an answer; without a free slot keep waiting on the running attempt
+                    if self.admission is not None and not self.admission.try_acquire():
+                        continue
+                    task = launch(backups.pop(0))
+                    if self.admission is not None:
+                        slot_holders.add(task)
+                    hedged = True
+                    continue
+                for task in done:
+                    finish(task)
+                    result = task.result()
+                    if result:
+                        self.stats[result["backend"]]["wins"] += 1
+                        upstreams["llm"].record_success()
+                        return {**result, "hedged": hedged}
+                # Every finished attempt failed, so move on to the next backend right away in the caller's slot
+                if not pending and backups:
+                    launch(backups.pop(0))
+                    hedged = True
+        finally:
+            for task in list(pending):
+                task.cancel()
+                finish(task)
+
+        print("All LLM backends failed or returned unusable replies, using fallback picks")
+        upstreams["llm"].record_failure()
+        return {"reply": "", "llm_data": fallback_recommendations(mood), "parse": "fallback", "backend": None, "hedged": hedged}
+
+    def metrics(self) -> Dict[str, Any]:
+        metrics = {"hedge_delay_seconds": round(self.hedge_delay(), 3), "backends": {}}
+        for name, stats in self.stats.items():
+            latencies = sorted(stats["latencies"])
+            metrics["backends"][name] = {
+                **{key: value for key, value in stats.items() if key != "latencies"},
+                "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+                "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))] * 1000, 1) if latencies else None
+            }
+        return metrics
+
+llm_router = LlmRouter([build_llm_backend(spec) for spec in LLM_BACKENDS], llm_admission)
 
 def get_genre_names(genre_ids, content_type="movie"):
     """Convert TMDB genre IDs to readable genre names"""
@@ -112,11 +725,13 @@ def get_genre_names(genre_ids, content_type="movie"):
     genre_map = tv_genres if content_type == "tv" else movie_genres
     return [genre_map.get(gid, "Unknown") for gid in genre_ids[:3]]  # Limit to 3 genres
 
-async def search_tmdb_content(title: str, content_type: str = "movie"):
-    """Search for content on TMDB and get detailed information including poster and trailer"""
+async def fetch_tmdb_search(title: str, content_type: str = "movie") -> Optional[Dict[str, Any]]:
+    """Search TMDB and return the card-level fields of the best match, or None when TMDB fails"""
     try:
-        base_url = "https://api.themoviedb.org/3"
-        search_url = f"{base_url}/search/{content_type}"
+        if upstreams["tmdb"].is_down():
+            raise UpstreamUnavailable("tmdb")
+        
+        search_url = f"{TMDB_API_BASE_URL}/search/{content_type}"
         
         params = {
             "api_key": TMDB_API_KEY,
@@ -127,73 +742,61 @@ async def search_tmdb_content(title: str, content_type: str = "movie"):
         }
         
         print(f"Searching TMDB for: {title} ({content_type})")
-        response = requests.get(search_url, params=params, timeout=10)
+        response = await asyncio.to_thread(get_http_session().get, search_url, params=params, timeout=10)
         
         if response.status_code == 200:
+            upstreams["tmdb"].record_success()
             data = response.json()
             results = data.get("results", [])
             
             if results:
-                # Get the first (most relevant) result
+                # Get the first (most relevant) result; trailer and cast are fetched lazily
                 content = results[0]
-                content_id = content.get("id")
-                
-                # Get additional details including trailers
-                details_url = f"{base_url}/{content_type}/{content_id}"
-                details_params = {
-                    "api_key": TMDB_API_KEY,
-                    "language": "en-US",
-                    "append_to_response": "videos,credits"
+                tmdb_result = {
+                    "id": str(content.get("id")),
+                    "title": content.get("title" if content_type == "movie" else "name", title),
+                    "overview": content.get("overview", f"An engaging {content_type} that perfectly matches your mood."),
+                    "genre_ids": content.get("genre_ids", []),
+                    "vote_average": content.get("vote_average", 7.0),
+                    "poster_path": content.get("poster_path"),
+                    "backdrop_path": content.get("backdrop_path"),
+                    "release_date": content.get("release_date" if content_type == "movie" else "first_air_date", "")
                 }
                 
-                details_response = requests.get(details_url, params=details_params, timeout=10)
-                
-                if details_response.status_code == 200:
-                    details_data = details_response.json()
-                    
-                    # Extract trailer URL
-                    trailer_url = None
-                    videos = details_data.get("videos", {}).get("results", [])
-                    for video in videos:
-                        if video.get("site") == "YouTube" and video.get("type") in ["Trailer", "Teaser"]:
-                            trailer_url = f"https://www.youtube.com/watch?v={video.get('key')}"
-                            break
-                    
-                    # Extract cast information
-                    cast = details_data.get("credits", {}).get("cast", [])
-                    cast_names = [actor.get("name") for actor in cast[:5]]  # Top 5 cast members
-                    
-                    # Build the response
-                    tmdb_result = {
-                        "id": str(content_id),
-                        "title": content.get("title" if content_type == "movie" else "name", title),
-                        "overview": content.get("overview", f"An engaging {content_type} that perfectly matches your mood."),
-                        "genre_ids": content.get("genre_ids", []),
-                        "vote_average": content.get("vote_average", 7.0),
-                        "poster_path": content.get("poster_path"),
-                        "backdrop_path": content.get("backdrop_path"),
-                        "trailer_url": trailer_url,
-                        "cast": cast_names,
-                        "release_date": content.get("release_date" if content_type == "movie" else "first_air_date", ""),
-                        "runtime": details_data.get("runtime") if content_type == "movie" else None,
-                        "episode_count": details_data.get("number_of_episodes") if content_type == "tv" else None
-                    }
-                    
-                    print(f"Found TMDB content: {tmdb_result['title']} with poster: {tmdb_result['poster_path']}")
-                    if trailer_url:
-                        print(f"Found trailer: {trailer_url}")
-                    
-                    return tmdb_result
-                else:
-                    print(f"TMDB details error: {details_response.status_code}")
+                print(f"Found TMDB content: {tmdb_result['title']} with poster: {tmdb_result['poster_path']}")
+                return tmdb_result
             else:
                 print(f"No TMDB results found for: {title}")
         else:
+            upstreams["tmdb"].record_failure()
             print(f"TMDB search error: {response.status_code}")
-            
+    
+    except UpstreamUnavailable:
+        pass
     except Exception as e:
+        upstreams["tmdb"].record_failure()
         print(f"TMDB search error for {title}: {e}")
     
+    return None
+
+async def search_tmdb_content(title: str, content_type: str = "movie", use_cache: bool = True):
+    """Get card-level TMDB metadata from the cache, TMDB, or the offline catalog"""
+    cache_key = (normalize_title(title), content_type)
+    cached = await tmdb_cache.get(cache_key) if use_cache else None
+    if cached is not None:
+        return cached
+    
+    tmdb_result = await fetch_tmdb_search(title, content_type)
+    if tmdb_result:
+        # A forced refresh replaces a value other workers may still hold
+        await tmdb_cache.set(cache_key, tmdb_result, publish=not use_cache)
+        return tmdb_result
+    
+    # Real metadata from the catalog snapshot beats a placeholder
+    entry = catalog.lookup(title, content_type)
+    if entry:
+        return entry
+    
     # Return fallback data if TMDB fails
     return {
         "id": str(uuid.uuid4()),
@@ -203,27 +806,99 @@ async def search_tmdb_content(title: str, content_type: str = "movie"):
         "vote_average": 7.0 + (hash(title) % 30) / 10,
         "poster_path": None,
         "backdrop_path": None,
-        "trailer_url": None,
-        "cast": [],
-        "release_date": "",
-        "runtime": None,
-        "episode_count": None
+        "release_date": ""
     }
 
-async def get_streaming_availability(title: str, content_type: str = "movie"):
-    """Get streaming availability from RapidAPI Streaming Availability API"""
+async def get_tmdb_details(content_type: str, tmdb_id: str) -> Optional[Dict[str, Any]]:
+    """Fetch trailer, cast, runtime and episode count for one title, cached per TMDB id; None when TMDB has no such title"""
+    cache_key = (content_type, tmdb_id)
+    cached = await tmdb_details_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    if upstreams["tmdb"].is_down():
+        raise UpstreamUnavailable("tmdb")
+    
+    details_url = f"{TMDB_API_BASE_URL}/{content_type}/{tmdb_id}"
+    details_params = {
+        "api_key": TMDB_API_KEY,
+        "language": "en-US",
+        "append_to_response": "videos,credits"
+    }
+    
     try:
-        # Try to get content by title first - search for shows
-        search_url = f"https://{RAPIDAPI_HOST}/shows/search/title"
+        details_response = await asyncio.to_thread(get_http_session().get, details_url, params=details_params, timeout=10)
+    except Exception:
+        upstreams["tmdb"].record_failure()
+        raise
+    # A 404 is TMDB answering that the id does not exist; anything else non-200 is TMDB failing
+    if details_response.status_code == 404:
+        upstreams["tmdb"].record_success()
+        return None
+    if details_response.status_code != 200:
+        upstreams["tmdb"].record_failure()
+        raise RuntimeError(f"TMDB details error: {details_response.status_code}")
+    upstreams["tmdb"].record_success()
+    details_data = details_response.json()
+    
+    # Extract trailer URL
+    trailer_url = None
+    videos = details_data.get("videos", {}).get("results", [])
+    for video in videos:
+        if video.get("site") == "YouTube" and video.get("type") in ["Trailer", "Teaser"]:
+            trailer_url = f"https://www.youtube.com/watch?v={video.get('key')}"
+            break
+    
+    # Extract cast information
+    cast = details_data.get("credits", {}).get("cast", [])
+    
+    details = {
+        "id": tmdb_id,
+        "type": content_type,
+        "trailer_url": trailer_url,
+        "cast": [actor.get("name") for actor in cast[:5]],  # Top 5 cast members
+        "runtime": details_data.get("runtime") if content_type == "movie" else None,
+        "episode_count": details_data.get("number_of_episodes") if content_type == "tv" else None
+    }
+    await tmdb_details_cache.set(cache_key, details)
+    return details
+
+def select_streaming_options(streaming_options: Dict[str, List[Dict[str, Any]]], country: str) -> List[Dict[str, Any]]:
+    """Slice one country's services out of a cached multi-country streamingOptions map"""
+    streaming_info = []
+    seen_services = set()
+    for option in streaming_options.get(country, [])[:5]:  # Limit to top 5 services
+        service_info = option.get("service", {})
+        service_name = service_info.get("name", "Unknown")
+        service_id = service_info.get("id", service_name.lower())
+        
+        # Avoid duplicates
+        if service_id not in seen_services:
+            seen_services.add(service_id)
+            
+            streaming_info.append({
+                "service": service_name,
+                "type": option.get("type", "subscription"),
+                "link": option.get("link", ""),
+                "quality": option.get("quality", "HD"),
+                "price": option.get("price", {}).get("formatted", "") if option.get("price") else ""
+            })
+    return streaming_info
+
+async def fetch_streaming_options(title: str, content_type: str = "movie") -> Tuple[Optional[Dict[str, List[Dict[str, Any]]]], bool]:
+    """Fetch the streamingOptions map for every country a title is available in, and whether the map is complete"""
+    try:
+        if upstreams["streaming"].is_down():
+            raise UpstreamUnavailable("streaming")
+        
         headers = {
             "X-RapidAPI-Key": RAPIDAPI_KEY,
             "X-RapidAPI-Host": RAPIDAPI_HOST
         }
         
-        # Search for the title
+        # Search for the title; the search endpoint requires a country
         search_params = {
             "title": title,
-            "country": "us",
+            "country": DEFAULT_COUNTRY,
             "series_granularity": "show" if content_type == "tv" else None,
             "show_type": content_type,
             "output_language": "en"
@@ -234,199 +909,1587 @@ async def get_streaming_availability(title: str, content_type: str = "movie"):
         
         print(f"Searching for streaming availability: {title} ({content_type})")
         
-        # Make the API call
-        response = requests.get(search_url, headers=headers, params=search_params, timeout=15)
+        search_url = f"https://{RAPIDAPI_HOST}/shows/search/title"
+        response = await asyncio.to_thread(get_http_session().get, search_url, headers=headers, params=search_params, timeout=15)
         
         if response.status_code == 200:
+            upstreams["streaming"].record_success()
             data = response.json()
-            streaming_info = []
             
             # Check if we got results
             if data and len(data) > 0:
                 # Get the first result (most relevant)
                 show_data = data[0]
                 streaming_options = show_data.get("streamingOptions", {})
+                complete = False
                 
-                # Get US streaming options
-                us_options = streaming_options.get("us", [])
+                # Without a country the show endpoint returns availability for all countries
+                if show_data.get("id"):
+                    show_params = {k: v for k, v in search_params.items() if k in ("series_granularity", "output_language")}
+                    show_url = f"https://{RAPIDAPI_HOST}/shows/{show_data['id']}"
+                    show_response = await asyncio.to_thread(get_http_session().get, show_url, headers=headers, params=show_params, timeout=15)
+                    if show_response.status_code == 200:
+                        streaming_options = show_response.json().get("streamingOptions", streaming_options)
+                        complete = True
+                    else:
+                        print(f"Streaming show lookup error: {show_response.status_code} - using {DEFAULT_COUNTRY} options only")
                 
-                # Process streaming services
-                seen_services = set()
-                for option in us_options[:5]:  # Limit to top 5 services
-                    service_info = option.get("service", {})
-                    service_name = service_info.get("name", "Unknown")
-                    service_id = service_info.get("id", service_name.lower())
-                    
-                    # Avoid duplicates
-                    if service_id not in seen_services:
-                        seen_services.add(service_id)
-                        
-                        # Map service types
-                        option_type = option.get("type", "subscription")
-                        
-                        streaming_info.append({
-                            "service": service_name,
-                            "type": option_type,
-                            "link": option.get("link", ""),
-                            "quality": option.get("quality", "HD"),
-                            "price": option.get("price", {}).get("formatted", "") if option.get("price") else ""
-                        })
-                
-                print(f"Found {len(streaming_info)} streaming options for {title}")
-                return streaming_info
+                print(f"Found streaming options in {len(streaming_options)} countries for {title}")
+                return streaming_options, complete
             else:
                 print(f"No streaming results found for: {title}")
                 
         elif response.status_code == 429:
+            upstreams["streaming"].record_failure()
             print("Rate limit reached for streaming API")
         elif response.status_code == 404:
             print(f"Streaming API endpoint not found - trying alternative approach")
         else:
+            upstreams["streaming"].record_failure()
             print(f"Streaming API error: {response.status_code} - {response.text}")
-            
+    
+    except UpstreamUnavailable:
+        pass
     except Exception as e:
+        upstreams["streaming"].record_failure()
         print(f"Streaming availability error for {title}: {e}")
     
-    # Return intelligent mock data based on content type and title
-    mock_services = []
+    return None, False
+
+async def get_streaming_availability(title: str, content_type: str = "movie", country: Optional[str] = None, use_cache: bool = True):
+    """Get streaming availability for one country, fetching each title's multi-country map once"""
+    country = country or DEFAULT_COUNTRY
+    cache_key = (normalize_title(title), content_type)
+    streaming_options = await streaming_cache.get(cache_key) if use_cache else None
+    if streaming_options is None:
+        streaming_options, complete = await fetch_streaming_options(title, content_type)
+        if streaming_options is not None:
+            # A map from the search call alone only covers DEFAULT_COUNTRY, so it is kept briefly and the show lookup retried
+            ttl = STREAMING_CACHE_TTL if complete else STREAMING_PARTIAL_CACHE_TTL
+            await streaming_cache.set(cache_key, streaming_options, publish=not use_cache, ttl=ttl)
+    
+    if streaming_options is not None:
+        return select_streaming_options(streaming_options, country)
     
-    # Smart mock data based on title patterns
-    title_lower = title.lower()
+    # Fall back to the snapshot for countries it covers, then to the keyword guess
+    entry = catalog.lookup(title, content_type)
+    if entry and country in entry.get("streaming", {}):
+        return select_streaming_options(entry["streaming"], country)
     
-    # Disney content
-    if any(word in title_lower for word in ["disney", "pixar", "marvel", "star wars", "moana", "frozen", "toy story", "coco", "encanto", "lion king"]):
-        mock_services.append({"service": "Disney+", "type": "subscription", "link": "https://disneyplus.com", "quality": "4K", "price": ""})
+    return mock_streaming_services(title, content_type)
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton reporting every label whose keyword occurs in a text, in one pass over the text"""
+
+    def __init__(self, keywords: Dict[str, set]):
+        # Node 0 is the root; each node has goto edges, a failure link and the labels it completes
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[frozenset] = [frozenset()]
+        for keyword, labels in keywords.items():
+            node = 0
+            for char in keyword:
+                if char not in self.goto[node]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(frozenset())
+                    self.goto[node][char] = len(self.goto) - 1
+                node = self.goto[node][char]
+            self.output[node] = self.output[node] | frozenset(labels)
+        
+        # Breadth-first failure links; outputs inherit from their failure node so overlaps are reported
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[child] = target if target != child else 0
+                self.output[child] = self.output[child] | self.output[self.fail[child]]
+
+    def match(self, text: str) -> set:
+        labels = set()
+        node = 0
+        for char in text:
+            while node and char not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+            labels |= self.output[node]
+        return labels
+
+class StreamingRules:
+    """Provider keyword rules from STREAMING_RULES_PATH, compiled into one automaton and reloaded when the file changes"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.mtime: Optional[float] = None
+        self.checked_at = 0.0
+        self.providers: List[Dict[str, Any]] = []
+        self.defaults: List[Dict[str, Any]] = []
+        self.max_services = 4
+        self.automaton = KeywordAutomaton({})
+        self.memo = TTLCache(STREAMING_CACHE_TTL, METADATA_CACHE_MAX_ENTRIES)
+        self.reload_if_changed(force=True)
+
+    def reload_if_changed(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self.checked_at < STREAMING_RULES_CHECK_INTERVAL:
+            return
+        self.checked_at = now
+        try:
+            mtime = os.stat(self.path).st_mtime
+            if mtime == self.mtime:
+                return
+            with open(self.path, "rb") as f:
+                rules = orjson.loads(f.read())
+            keywords: Dict[str, set] = {}
+            for position, provider in enumerate(rules.get("providers", [])):
+                for keyword in provider.get("keywords", []) + provider.get("franchises", []):
+                    keywords.setdefault(keyword.lower(), set()).add(position)
+            # Swap everything in at once so a bad file never leaves half-applied rules
+            self.automaton = KeywordAutomaton(keywords)
+            self.providers = rules.get("providers", [])
+            self.defaults = rules.get("defaults", [])
+            self.max_services = rules.get("max_services", 4)
+            self.memo = TTLCache(STREAMING_CACHE_TTL, METADATA_CACHE_MAX_ENTRIES)
+            self.mtime = mtime
+            print(f"Loaded {len(self.providers)} streaming providers with {len(keywords)} keywords from {self.path}")
+        except Exception as e:
+            print(f"Streaming rules not reloaded from {self.path}: {e}")
+
+    def services_for(self, title: str, content_type: str) -> List[Dict[str, Any]]:
+        self.reload_if_changed()
+        cache_key = (title.lower(), content_type)
+        cached = self.memo.get(cache_key)
+        if cached is not None:
+            return cached
         
-    # Netflix originals and popular content
-    if any(word in title_lower for word in ["netflix", "stranger things", "the crown", "wednesday", "squid game", "dark", "money heist"]):
-        mock_services.append({"service": "Netflix", "type": "subscription", "link": "https://netflix.com", "quality": "4K", "price": ""})
-    elif content_type == "tv":
-        mock_services.append({"service": "Netflix", "type": "subscription", "link": "https://netflix.com", "quality": "4K", "price": ""})
+        matched = self.automaton.match(cache_key[0])
+        services = [
+            dict(provider["offer"]) for position, provider in enumerate(self.providers)
+            if position in matched or content_type in provider.get("always_for", [])
+        ]
+        for default in self.defaults:
+            offer = default["offer"]
+            if content_type in default.get("content_types", []) and not any(service["service"] == offer["service"] for service in services):
+                services.append(dict(offer))
+        services = services[:self.max_services]
+        self.memo.set(cache_key, services)
+        return services
+
+streaming_rules = StreamingRules(STREAMING_RULES_PATH)
+
+def mock_streaming_services(title: str, content_type: str = "movie") -> List[Dict[str, Any]]:
+    """Guess likely streaming services from title keywords when no real data is available"""
+    # Copies, so callers can't alter the memoized result
+    return [dict(service) for service in streaming_rules.services_for(title, content_type)]
+
+# Image proxy with a size-bounded LRU disk cache
+class ImageDiskCache:
+    """LRU cache of proxied TMDB images stored as files under IMAGE_CACHE_DIR, shared by all worker processes"""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        # A local estimate of the directory; the files and their mtimes are the shared truth
+        self.entries: "OrderedDict[str, int]" = OrderedDict()
+        self.inflight: Dict[str, asyncio.Future] = {}
+        self.loaded = False
+        # get and put run in worker threads
+        self.lock = threading.Lock()
+
+    def _scan(self):
+        """Rebuild sizes and LRU order from the directory, picking up files other workers added or evicted"""
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        self.entries = OrderedDict((name, size) for _, name, size in sorted(files))
+        self.total_bytes = sum(self.entries.values())
+        self.loaded = True
+
+    def _evict(self):
+        # Sibling workers write to the same directory, so with several of them the size is recounted from disk;
+        # this only runs after a download, which costs far more than the scan
+        if self.total_bytes > self.max_bytes or SERVER_WORKERS > 1:
+            self._scan()
+        while self.total_bytes > self.max_bytes and self.entries:
+            name, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self.lock:
+            if not self.loaded:
+                self._scan()
+                self._evict()
+        # Read through to the file even when it is not in entries, since another worker may have written it
+        file_path = os.path.join(self.directory, key)
+        try:
+            with open(file_path, "rb") as f:
+                data = f.read()
+            # Reads touch the mtime, which is the LRU order every worker evicts by
+            os.utime(file_path)
+        except OSError:
+            with self.lock:
+                self.total_bytes -= self.entries.pop(key, 0)
+            return None
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = len(data)
+                self.total_bytes += len(data)
+            self.entries.move_to_end(key)
+        return data
+
+    def put(self, key: str, data: bytes):
+        with self.lock:
+            if not self.loaded:
+                self._scan()
+        file_path = os.path.join(self.directory, key)
+        tmp_path = f"{file_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, file_path)
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key)
+            self.entries[key] = len(data)
+            self.total_bytes += len(data)
+            self._evict()
+
+    async def fetch(self, size: str, path: str) -> Optional[bytes]:
+        """Return image bytes from disk, downloading from TMDB once on a miss"""
+        key = f"{size}_{path}"
+        data = await asyncio.to_thread(self.get, key)
+        if data is not None:
+            return data
+
+        # Concurrent misses for the same image share one upstream download
+        if key in self.inflight:
+            return await asyncio.shield(self.inflight[key])
+
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        try:
+            response = await asyncio.to_thread(get_http_session().get, f"{TMDB_IMAGE_BASE_URL}/{size}/{path}", timeout=10)
+            data = response.content if response.status_code == 200 else None
+            if data:
+                await asyncio.to_thread(self.put, key, data)
+            else:
+                print(f"TMDB image error: {response.status_code} for {size}/{path}")
+        except Exception as e:
+            print(f"TMDB image fetch error for {size}/{path}: {e}")
+            data = None
+        finally:
+            future.set_result(data)
+            del self.inflight[key]
+        return data
+
+image_cache = ImageDiskCache(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES)
+
+def build_image_url(path: Optional[str], size: str) -> Optional[str]:
+    """Build a proxied image URL for a TMDB file path such as '/abc.jpg'"""
+    if not path:
+        return None
+    return f"{PUBLIC_API_URL}/api/images/{size}/{path.lstrip('/')}"
+
+def build_image_srcset(path: Optional[str], sizes: List[str]) -> Optional[str]:
+    """Build an HTML srcset value listing every configured width of an image"""
+    if not path:
+        return None
+    return ", ".join(f"{build_image_url(path, size)} {size[1:]}w" for size in sizes)
+
+def build_recommendation(tmdb_data: Dict[str, Any], content_type: str, streaming_info: List[Dict[str, Any]], reason: str) -> Dict[str, Any]:
+    """Build a recommendation dict matching the Recommendation schema without model validation"""
+    return {
+        "id": tmdb_data["id"],
+        "title": tmdb_data["title"],
+        "type": content_type,
+        "overview": tmdb_data["overview"],
+        "genre": get_genre_names(tmdb_data.get("genre_ids", []), content_type),
+        "rating": float(tmdb_data["vote_average"]),
+        "poster_url": build_image_url(tmdb_data.get("poster_path"), POSTER_SIZES[-1]),
+        "backdrop_url": build_image_url(tmdb_data.get("backdrop_path"), BACKDROP_SIZES[-1]),
+        "poster_srcset": build_image_srcset(tmdb_data.get("poster_path"), POSTER_SIZES),
+        "backdrop_srcset": build_image_srcset(tmdb_data.get("backdrop_path"), BACKDROP_SIZES),
+        "trailer_url": None,
+        "details_url": f"/api/content/{content_type}/{tmdb_data['id']}" if tmdb_data["id"].isdigit() else None,
+        "streaming_availability": streaming_info,
+        "recommendation_reason": reason,
+    }
+
+def estimate_tokens(text: str) -> int:
+    """Estimate a token count at ~4 characters per token; all usage figures are estimates, not provider-reported"""
+    return max(1, len(text) // 4) if text else 0
+
+def extract_json_object(text: str) -> Optional[Dict[str, Any]]:
+    """Recover the first JSON object from a reply that may be fenced or wrapped in prose"""
+    text = text.strip()
+    fenced = re.search(r"```(?:json)?\s*(.*?)```", text, re.DOTALL)
+    candidates = [text, fenced.group(1).strip()] if fenced else [text]
+    decoder = json.JSONDecoder()
+    for candidate in candidates:
+        try:
+            data = json.loads(candidate)
+            if isinstance(data, dict):
+                return data
+        except json.JSONDecodeError:
+            pass
+        # Try every opening brace so leading prose or a stray brace does not stop the scan
+        for match in re.finditer(r"\{", candidate):
+            try:
+                data, _ = decoder.raw_decode(candidate, match.start())
+            except json.JSONDecodeError:
+                continue
+            if isinstance(data, dict) and "recommendations" in data:
+                return data
+    return None
+
+def validate_llm_payload(data: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Keep only well-formed recommendation items; None when nothing usable remains"""
+    if not isinstance(data, dict) or not isinstance(data.get("recommendations"), list):
+        return None
+    recommendations = []
+    for item in data["recommendations"]:
+        if not isinstance(item, dict) or not isinstance(item.get("title"), str) or not item["title"].strip():
+            continue
+        content_type = str(item.get("type", "movie")).lower()
+        recommendations.append({
+            "title": item["title"].strip(),
+            "type": "tv" if content_type in ("tv", "series", "show") else "movie",
+            "reason": str(item.get("reason") or "Perfect match for your current vibe!")
+        })
+    if not recommendations:
+        return None
+    return {"mood_interpretation": str(data.get("mood_interpretation") or ""), "recommendations": recommendations}
+
+def fallback_recommendations(mood: str) -> Dict[str, Any]:
+    """Curated picks used when the LLM reply cannot be parsed"""
+    return {
+        "mood_interpretation": f"I understand you're looking for something that matches your '{mood}' vibe.",
+        "recommendations": [
+            {"title": "The Grand Budapest Hotel", "type": "movie", "reason": "A whimsical, beautifully crafted film perfect for your mood."},
+            {"title": "Avatar: The Last Airbender", "type": "tv", "reason": "An epic adventure with heart and stunning visuals."},
+            {"title": "Spirited Away", "type": "movie", "reason": "A magical journey that captures wonder and emotion."},
+            {"title": "Ted Lasso", "type": "tv", "reason": "Heartwarming comedy that lifts spirits and inspires."},
+            {"title": "Your Name", "type": "movie", "reason": "A beautiful animated film about connection and fate."}
+        ]
+    }
+
+def parse_llm_recommendations(llm_response: str, mood: str) -> Tuple[Dict[str, Any], str]:
+    """Parse the LLM reply into the recommendation schema and report how it was obtained"""
+    text = llm_response.strip()
+    try:
+        llm_data = validate_llm_payload(json.loads(text))
+        if llm_data:
+            return llm_data, "json"
+    except json.JSONDecodeError:
+        pass
+    
+    llm_data = validate_llm_payload(extract_json_object(text))
+    if llm_data:
+        return llm_data, "recovered"
+    
+    print(f"Could not parse LLM reply, using fallback picks: {text[:200]}")
+    return fallback_recommendations(mood), "fallback"
+
+async def request_llm_recommendations(prompt: str, mood: str, priority: str, session_id: str, chat=None, backend=None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Get parsed picks through admission control, from a live chat or the hedging router, with usage accounting"""
+    # Stateless prompts are shared across workers; identical prompts skip the LLM and its admission slot
+    cache_key = hashlib.sha256(prompt.encode()).hexdigest()
+    if chat is None:
+        cached = await llm_result_cache.get(cache_key)
+        if cached is not None:
+            return cached["llm_data"], {
+                "model": cached["backend"],
+                "hedged": False,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "max_tokens": LLM_MAX_TOKENS,
+                "latency_ms": 0.0,
+                "parse": cached["parse"],
+                "cached": True
+            }
+    
+    async with llm_admission.slot(priority):
+        started = time.perf_counter()
+        if chat is not None:
+            # Conversational sessions keep their context in one chat, so they cannot be hedged
+            backend = backend or llm_router.backends[0]
+            try:
+                llm_response = await backend.send(chat, prompt)
+            except Exception:
+                upstreams["llm"].record_failure()
+                raise
+            llm_data, parse_mode = parse_llm_recommendations(llm_response, mood)
+            # Like the router, an unusable reply counts against the breaker
+            if parse_mode == "fallback":
+                upstreams["llm"].record_failure()
+            else:
+                upstreams["llm"].record_success()
+            result = {"reply": llm_response, "llm_data": llm_data, "parse": parse_mode, "backend": backend.name, "hedged": False}
+        else:
+            result = await llm_router.route(session_id, prompt, mood)
+            if result["parse"] != "fallback":
+                await llm_result_cache.set(cache_key, {key: result[key] for key in ("llm_data", "parse", "backend")})
+        latency_ms = (time.perf_counter() - started) * 1000
+    
+    usage = {
+        "model": result["backend"],
+        "hedged": result["hedged"],
+        "prompt_tokens": estimate_tokens(RECOMMENDATION_SYSTEM_PROMPT) + estimate_tokens(prompt),
+        "completion_tokens": estimate_tokens(result["reply"]),
+        "max_tokens": LLM_MAX_TOKENS,
+        "latency_ms": round(latency_ms, 1),
+        "parse": result["parse"]
+    }
+    record_llm_usage(usage)
+    return result["llm_data"], usage
+
+def record_llm_usage(usage: Dict[str, Any]):
+    llm_usage_stats["requests"] += 1
+    llm_usage_stats["prompt_tokens"] += usage["prompt_tokens"]
+    llm_usage_stats["completion_tokens"] += usage["completion_tokens"]
+    llm_usage_stats["total_latency_ms"] += usage["latency_ms"]
+    llm_usage_stats["parse"][usage["parse"]] += 1
+
+async def enrich_recommendation(rec: Dict[str, Any], country: str) -> Optional[Dict[str, Any]]:
+    """Attach TMDB metadata and streaming availability to one LLM suggestion"""
+    title = rec.get("title", "")
+    content_type = rec.get("type", "movie")
+    reason = rec.get("reason", "Perfect match for your current vibe!")
+    
+    # Catalog picks are served straight from the snapshot
+    if rec.get("source") == "catalog":
+        entry = catalog.lookup(title, content_type)
+        if entry:
+            return build_catalog_recommendation(entry, country, reason)
+    
+    # Search TMDB for metadata
+    tmdb_data = await search_tmdb_content(title, content_type)
+    
+    # Get streaming availability
+    streaming_info = await get_streaming_availability(title, content_type, country)
+    
+    if not tmdb_data:
+        return None
+    return build_recommendation(tmdb_data, content_type, streaming_info, reason)
+
+# Per-user seen-titles filter
+class SeenTitlesFilter:
+    """Two-generation Bloom filter over the (title, type) pairs a user has already been shown
+
+    Each generation is sized for SEEN_FILTER_CAPACITY titles at SEEN_FILTER_ERROR_RATE. Once the current
+    one is full it becomes the previous one and the oldest titles are forgotten, so the false-positive
+    rate stays bounded however long a user keeps asking.
+    """
+
+    def __init__(
+        self,
+        data: Optional[bytes] = None,
+        previous: Optional[bytes] = None,
+        count: int = 0,
+        capacity: int = SEEN_FILTER_CAPACITY,
+        error_rate: float = SEEN_FILTER_ERROR_RATE
+    ):
+        self.capacity = capacity
+        # Optimal Bloom sizing: m = -n ln p / (ln 2)^2 bits and k = m/n ln 2 hashes, rounded up to whole bytes
+        self.bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2 / 8) * 8
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.array = self._load(data)
+        self.previous = self._load(previous)
+        self.count = count if data is not None and len(self.array) == len(data) else 0
+
+    @classmethod
+    def from_profile(cls, profile: Optional[Dict[str, Any]]) -> "SeenTitlesFilter":
+        if not profile:
+            return cls()
+        return cls(profile.get("seen_filter"), profile.get("seen_filter_previous"), profile.get("seen_filter_count", 0))
+
+    def _load(self, data: Optional[bytes]) -> bytearray:
+        # A filter stored with a different size cannot be reused, so it starts over
+        return bytearray(data) if data and len(data) == self.bits // 8 else bytearray(self.bits // 8)
+
+    def _positions(self, title: str, content_type: str) -> List[int]:
+        key = f"{normalize_title(title)}|{content_type}"
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, title: str, content_type: str):
+        for position in self._positions(title, content_type):
+            self.array[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+        self._rotate_if_full()
+
+    def contains(self, title: str, content_type: str) -> bool:
+        positions = self._positions(title, content_type)
+        return any(
+            all(array[position >> 3] & (1 << (position & 7)) for position in positions)
+            for array in (self.array, self.previous)
+        )
+
+    def merge(self, other: "SeenTitlesFilter"):
+        """Add another filter's current generation, e.g. one session's titles, to this one"""
+        for index, byte in enumerate(other.array):
+            self.array[index] |= byte
+        self.count += other.count
+        self._rotate_if_full()
+
+    def _rotate_if_full(self):
+        if self.count >= self.capacity:
+            self.previous, self.array, self.count = self.array, bytearray(self.bits // 8), 0
+
+    def to_fields(self) -> Dict[str, Any]:
+        return {"seen_filter": bytes(self.array), "seen_filter_previous": bytes(self.previous), "seen_filter_count": self.count}
+
+async def load_seen_profile(user_id: Optional[str]) -> Tuple[Optional[SeenTitlesFilter], List[str]]:
+    """Load a user's seen-titles filter and recent titles with one point lookup"""
+    if not user_id:
+        return None, []
+    profile = await db.user_profiles.find_one({"_id": user_id}, {"seen_filter": 1, "seen_filter_previous": 1, "seen_filter_count": 1, "recent_titles": 1})
+    return SeenTitlesFilter.from_profile(profile), (profile or {}).get("recent_titles", [])
+
+async def record_seen_titles(
+    user_id: Optional[str],
+    seen_filter: Optional[SeenTitlesFilter],
+    recommendations: List[Dict[str, Any]],
+    picks: Optional[List[Dict[str, Any]]] = None
+):
+    """Add shown titles to the user's filter and keep a short list of the latest ones for the prompt"""
+    from pymongo.errors import DuplicateKeyError
+    
+    if not user_id or seen_filter is None or not recommendations:
+        return
+    # Cards carry TMDB's canonical title while later picks arrive with the LLM's spelling, so both are added
+    additions = SeenTitlesFilter()
+    for item in recommendations + (picks or []):
+        additions.add(item["title"], item.get("type", "movie"))
+    seen_filter.merge(additions)
+    
+    # Concurrent sessions for one user each hold a stale copy, so merge into the stored bits
+    # and retry if the profile changed in between instead of overwriting it
+    for _ in range(5):
+        profile = await db.user_profiles.find_one({"_id": user_id}, {"seen_filter": 1, "seen_filter_previous": 1, "seen_filter_count": 1, "seen_version": 1})
+        merged = SeenTitlesFilter.from_profile(profile)
+        merged.merge(additions)
+        update = {
+            "$set": {**merged.to_fields(), "updated_at": datetime.utcnow()},
+            "$inc": {"seen_count": len(recommendations), "seen_version": 1},
+            "$push": {"recent_titles": {
+                "$each": [f"{rec['title']} ({rec['type']})" for rec in recommendations],
+                "$slice": -SEEN_PROMPT_TITLES
+            }}
+        }
+        try:
+            if profile is None:
+                await db.user_profiles.insert_one({"_id": user_id})
+            result = await db.user_profiles.update_one({"_id": user_id, "seen_version": profile.get("seen_version") if profile else None}, update)
+        except DuplicateKeyError:
+            continue
+        if result.modified_count:
+            return
+    print(f"Could not record seen titles for user {user_id} after repeated conflicts")
+
+def build_mood_prompt(mood: str, recent_titles: List[str]) -> str:
+    """Append a short exclusion list so the LLM avoids titles the user just saw"""
+    if not recent_titles:
+        return mood
+    return f"{mood}\nAlready recommended, suggest different titles: {'; '.join(recent_titles)}"
+
+def filter_unseen(picks: List[Dict[str, Any]], seen_filter: Optional[SeenTitlesFilter]) -> List[Dict[str, Any]]:
+    """Drop picks the user has probably seen, unless that would leave nothing to show"""
+    if seen_filter is None:
+        return picks
+    unseen = [pick for pick in picks if not seen_filter.contains(pick.get("title", ""), pick.get("type", "movie"))]
+    return unseen or picks
+
+# Offline catalog and upstream health
+class UpstreamUnavailable(Exception):
+    """Raised to skip a call to an upstream that is currently marked down"""
+
+class UpstreamHealth:
+    """Circuit breaker that marks an upstream down after consecutive failures"""
+
+    def __init__(self, name: str, threshold: int, cooldown: int):
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.down_until = 0.0
+
+    def record_success(self):
+        self.failures = 0
+        self.down_until = 0.0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self.down_until = time.monotonic() + self.cooldown
+
+    def is_down(self) -> bool:
+        # Once the cooldown passes the next call is let through as a probe
+        return time.monotonic() < self.down_until
+
+    def status(self) -> Dict[str, Any]:
+        return {"down": self.is_down(), "consecutive_failures": self.failures}
+
+upstreams = {name: UpstreamHealth(name, UPSTREAM_FAILURE_THRESHOLD, UPSTREAM_COOLDOWN) for name in ("llm", "tmdb", "streaming")}
+
+def upstreams_degraded() -> bool:
+    """Serve whole requests from the catalog while the LLM or TMDB is down"""
+    return upstreams["llm"].is_down() or upstreams["tmdb"].is_down()
+
+# Words in a mood description that point at each catalog mood tag
+MOOD_KEYWORDS = {
+    "cozy": ["cozy", "cosy", "rainy", "comfort", "comforting", "warm", "snug", "relax", "relaxing", "chill", "sunday"],
+    "funny": ["funny", "laugh", "comedy", "hilarious", "lighthearted", "silly", "witty"],
+    "dark": ["dark", "gritty", "bleak", "noir", "twisted", "disturbing", "grim"],
+    "scary": ["scary", "horror", "spooky", "creepy", "terrifying", "halloween", "fright"],
+    "romantic": ["romantic", "romance", "date", "love", "swoon"],
+    "family": ["family", "kids", "children", "wholesome", "animated", "disney", "pixar"],
+    "action": ["action", "adrenaline", "explosive", "fight", "thrilling", "superhero", "marvel"],
+    "mind-bending": ["mind", "mind-bending", "twist", "twisty", "puzzle", "cerebral", "trippy", "think", "sci-fi"],
+    "emotional": ["cry", "sad", "tearjerker", "emotional", "moving", "heartbreaking", "bittersweet"],
+    "uplifting": ["uplifting", "feel-good", "inspiring", "hopeful", "happy", "heartwarming", "cheer"],
+    "epic": ["epic", "adventure", "fantasy", "quest", "grand", "sweeping"],
+    "suspense": ["suspense", "thriller", "tense", "mystery", "crime", "detective", "edge"],
+    "nostalgic": ["nostalgic", "nostalgia", "classic", "retro", "80s", "90s", "childhood"],
+    "whimsical": ["whimsical", "magical", "magic", "quirky", "dreamy", "ghibli"],
+}
+
+# Default mood tags for titles whose snapshot entry was built from TMDB genres alone
+GENRE_MOOD_TAGS = {
+    "Comedy": "funny", "Horror": "scary", "Romance": "romantic", "Family": "family", "Animation": "family",
+    "Kids": "family", "Action": "action", "Action & Adventure": "action", "Thriller": "suspense",
+    "Crime": "suspense", "Mystery": "suspense", "Science Fiction": "mind-bending", "Sci-Fi & Fantasy": "mind-bending",
+    "Fantasy": "whimsical", "Adventure": "epic", "Drama": "emotional", "War": "dark", "War & Politics": "dark",
+}
+
+class CatalogIndex:
+    """In-memory index over the offline catalog snapshot, by title and by mood tag"""
+
+    def __init__(self, entries: List[Dict[str, Any]]):
+        self.entries = entries
+        self.by_title: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.by_tag: Dict[str, List[int]] = {}
+        for position, entry in enumerate(entries):
+            self.by_title[(normalize_title(entry["title"]), entry["type"])] = entry
+            tags = entry.get("mood_tags") or sorted({
+                GENRE_MOOD_TAGS[name] for name in get_genre_names(entry.get("genre_ids", []), entry["type"]) if name in GENRE_MOOD_TAGS
+            })
+            for tag in tags:
+                self.by_tag.setdefault(tag, []).append(position)
+        self.keyword_tags = {keyword: tag for tag, keywords in MOOD_KEYWORDS.items() for keyword in keywords}
+
+    @classmethod
+    def load(cls, path: str) -> "CatalogIndex":
+        try:
+            with open(path, "rb") as f:
+                entries = orjson.loads(f.read()).get("entries", [])
+            print(f"Loaded offline catalog with {len(entries)} titles from {path}")
+            return cls(entries)
+        except Exception as e:
+            print(f"Offline catalog unavailable ({path}): {e}")
+            return cls([])
+
+    def lookup(self, title: str, content_type: str) -> Optional[Dict[str, Any]]:
+        return self.by_title.get((normalize_title(title), content_type))
+
+    def mood_tags(self, mood: str) -> List[str]:
+        words = re.findall(r"[a-z0-9-]+", mood.lower())
+        return list(dict.fromkeys(self.keyword_tags[word] for word in words if word in self.keyword_tags))
+
+    def search(self, mood: str, limit: int = 5, seen_filter: Optional[SeenTitlesFilter] = None) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """Rank entries by shared mood tags, then rating, skipping titles the user has seen"""
+        tags = self.mood_tags(mood)
+        mood_lower = mood.lower()
+        wants_type = "tv" if any(word in mood_lower for word in ("show", "series", "tv", "binge")) else (
+            "movie" if any(word in mood_lower for word in ("movie", "film")) else None
+        )
         
-    # HBO content
-    if any(word in title_lower for word in ["hbo", "game of thrones", "succession", "euphoria", "house of dragon", "last of us"]):
-        mock_services.append({"service": "HBO Max", "type": "subscription", "link": "https://hbomax.com", "quality": "4K", "price": ""})
+        scores: Dict[int, float] = {}
+        for tag in tags:
+            for position in self.by_tag.get(tag, []):
+                scores[position] = scores.get(position, 0) + 3
         
-    # Amazon Prime content
-    if any(word in title_lower for word in ["amazon", "prime", "rings of power", "boys", "marvelous", "grand tour"]):
-        mock_services.append({"service": "Prime Video", "type": "subscription", "link": "https://primevideo.com", "quality": "4K", "price": ""})
+        # Untagged titles still rank by rating so a well-watched mood never runs dry
+        ranked = []
+        for position in range(len(self.entries)):
+            entry = self.entries[position]
+            if seen_filter is not None and seen_filter.contains(entry["title"], entry["type"]):
+                continue
+            score = scores.get(position, 0) + (1 if entry["type"] == wants_type else 0) + float(entry.get("vote_average") or 0) / 10
+            ranked.append((score, entry))
+        ranked.sort(key=lambda item: item[0], reverse=True)
+        return [entry for _, entry in ranked[:limit]], tags
+
+catalog = CatalogIndex.load(CATALOG_SNAPSHOT_PATH)
+
+def catalog_recommendations(mood: str, seen_filter: Optional[SeenTitlesFilter] = None) -> Dict[str, Any]:
+    """Build LLM-shaped picks from the offline catalog"""
+    entries, tags = catalog.search(mood, 5, seen_filter)
+    if not entries:
+        return fallback_recommendations(mood)
+    feel = ", ".join(tags) if tags else "crowd-pleasing"
+    return {
+        "mood_interpretation": f"Poppy is running in offline mode, so here are catalog picks with a {feel} feel for '{mood}'.",
+        "recommendations": [
+            {
+                "title": entry["title"],
+                "type": entry["type"],
+                "reason": f"A {', '.join(entry.get('mood_tags', [])[:2]) or 'well-loved'} pick that fits your vibe.",
+                "source": "catalog"
+            }
+            for entry in entries
+        ]
+    }
+
+def build_catalog_recommendation(entry: Dict[str, Any], country: str, reason: str) -> Dict[str, Any]:
+    """Build a recommendation from a snapshot entry without any upstream calls"""
+    if country in entry.get("streaming", {}):
+        streaming_info = select_streaming_options(entry["streaming"], country)
+    else:
+        streaming_info = mock_streaming_services(entry["title"], entry["type"])
+    return build_recommendation(entry, entry["type"], streaming_info, reason)
+
+async def check_tmdb_health():
+    """Probe TMDB's configuration endpoint so outages and recoveries are noticed between requests"""
+    try:
+        response = await asyncio.to_thread(get_http_session().get, f"{TMDB_API_BASE_URL}/configuration", params={"api_key": TMDB_API_KEY}, timeout=5)
+        if response.status_code == 200:
+            upstreams["tmdb"].record_success()
+        else:
+            upstreams["tmdb"].record_failure()
+    except Exception:
+        upstreams["tmdb"].record_failure()
+
+async def upstream_health_loop():
+    """Run active upstream health checks; the LLM and RapidAPI are only checked passively to save quota"""
+    while True:
+        await check_tmdb_health()
+        await asyncio.sleep(UPSTREAM_CHECK_INTERVAL)
+
+def compressed_json_response(request: Request, content: Any) -> Response:
+    """Serialize content once with orjson and compress it when the client accepts it"""
+    body = orjson.dumps(content, default=str)
+    headers = {"Vary": "Accept-Encoding"}
+    if len(body) >= COMPRESSION_MIN_BYTES:
+        accept_encoding = request.headers.get("accept-encoding", "")
+        if brotli is not None and "br" in accept_encoding:
+            body = brotli.compress(body, quality=4)
+            headers["Content-Encoding"] = "br"
+        elif "gzip" in accept_encoding:
+            body = gzip.compress(body, compresslevel=5)
+            headers["Content-Encoding"] = "gzip"
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# Startup warm-up
+async def get_top_recent_titles(limit: int, since: timedelta) -> List[Dict[str, Any]]:
+    """Return the most frequently recommended (title, type) pairs from recent sessions"""
+    pipeline = [
+        {"$match": {"created_at": {"$gte": datetime.utcnow() - since}}},
+        {"$unwind": "$recommendations"},
+        {"$group": {
+            "_id": {"title": "$recommendations.title", "type": "$recommendations.type"},
+            "count": {"$sum": 1}
+        }},
+        {"$sort": {"count": -1}},
+        {"$limit": limit}
+    ]
+    rows = await db.recommendations.aggregate(pipeline).to_list(length=limit)
+    return [{"title": row["_id"]["title"], "type": row["_id"]["type"], "count": row["count"]} for row in rows]
+
+async def ensure_indexes() -> str:
+    """Create the indexes the app relies on; safe to run on every start"""
+    # Jobs expire at expires_at; inflight_key is only set while a job is queued or running
+    await db.recommendation_jobs.create_index("expires_at", expireAfterSeconds=0)
+    await db.recommendation_jobs.create_index("inflight_key", unique=True, sparse=True)
+    # created_at TTL indexes also serve the history sort
+    await ensure_ttl_index(db.recommendations, SESSION_RETENTION_DAYS)
+    await ensure_ttl_index(db.feedback, FEEDBACK_RETENTION_DAYS)
+    await db.recommendations.create_index([("user_id", 1), ("created_at", -1)])
+    # Shared cache entries, invalidation notices and background-task leases clean themselves up
+    await db.cache_entries.create_index("expires_at", expireAfterSeconds=0)
+    await db.cache_invalidations.create_index("created_at", expireAfterSeconds=3600)
+    await db.leases.create_index("expires_at", expireAfterSeconds=3600)
+    return "ok"
+
+async def ensure_ttl_index(collection, retention_days: int):
+    """Create or resize the created_at TTL index; retention 0 keeps a plain index"""
+    from pymongo.errors import OperationFailure
+
+    if retention_days <= 0:
+        # TTL cannot be switched off in place, so an expiring index is rebuilt without it
+        if "expireAfterSeconds" in (await collection.index_information()).get("created_at_1", {}):
+            await collection.drop_index("created_at_1")
+        await collection.create_index("created_at")
+        return
+    # Leave the exporter at least one full day to archive yesterday's partition
+    if ARCHIVE_ENABLED:
+        retention_days = max(retention_days, 2)
+    seconds = retention_days * 86400
+    try:
+        await collection.create_index("created_at", expireAfterSeconds=seconds)
+    except OperationFailure:
+        # The index exists with other options, so change its expiry in place
+        await db.command("collMod", collection.name, index={"keyPattern": {"created_at": 1}, "expireAfterSeconds": seconds})
+
+async def ping_mongo() -> str:
+    """Open the Mongo connection pool with a ping"""
+    await client.admin.command("ping")
+    return "ok"
+
+async def warm_http_pool() -> str:
+    """Open pooled TLS connections to the upstream hosts"""
+    session = get_http_session()
+    urls = [f"{TMDB_API_BASE_URL}/configuration?api_key={TMDB_API_KEY}", f"{TMDB_IMAGE_BASE_URL}/"]
+    if RAPIDAPI_HOST:
+        urls.append(f"https://{RAPIDAPI_HOST}/")
+    await asyncio.gather(*[asyncio.to_thread(session.head, url, timeout=5) for url in urls], return_exceptions=True)
+    return f"{len(urls)} hosts"
+
+async def warm_metadata_caches() -> str:
+    """Preload TMDB and streaming caches with the top titles from recent history"""
+    titles = await get_top_recent_titles(WARMUP_TOP_TITLES, timedelta(days=WARMUP_HISTORY_DAYS))
+    for item in titles:
+        await search_tmdb_content(item["title"], item["type"])
+        await get_streaming_availability(item["title"], item["type"])
+    return f"{len(titles)} titles"
+
+async def ping_llm() -> str:
+    """Send one tiny prompt through the primary backend from LLM_BACKENDS so its client and connection are ready"""
+    backend = llm_router.backends[0]
+    chat = await backend.open_chat(f"warmup-{uuid.uuid4()}")
+    await backend.send(chat, "ping, reply with the single word: ok")
+    return backend.name
+
+async def run_warmup():
+    """Run each warm-up step with a timeout and record its outcome for /api/ready"""
+    started = time.perf_counter()
+    steps = [
+        ("mongo", ping_mongo),
+        ("indexes", ensure_indexes),
+        ("http_pool", warm_http_pool),
+        ("metadata_cache", warm_metadata_caches),
+    ]
+    if WARMUP_LLM_PING:
+        steps.append(("llm", ping_llm))
+
+    for name, step in steps:
+        step_started = time.perf_counter()
+        try:
+            detail = await asyncio.wait_for(step(), timeout=WARMUP_STEP_TIMEOUT)
+            warmup_state["checks"][name] = {"ok": True, "detail": detail}
+        except Exception as e:
+            print(f"Warm-up step {name} failed: {e}")
+            warmup_state["checks"][name] = {"ok": False, "detail": str(e) or type(e).__name__}
+        warmup_state["checks"][name]["duration_ms"] = round((time.perf_counter() - step_started) * 1000, 1)
+
+    warmup_state["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    # Only the database is required; other steps just make the first requests faster
+    warmup_state["ready"] = warmup_state["checks"]["mongo"]["ok"]
+    print(f"Warm-up finished in {warmup_state['duration_ms']} ms, ready={warmup_state['ready']}")
+
+async def acquire_lease(name: str, ttl: int) -> bool:
+    """Hold a named lease in Mongo so only one worker runs a singleton background task"""
+    from pymongo.errors import DuplicateKeyError
+
+    now = datetime.utcnow()
+    try:
+        # Matches when this worker already holds the lease or it has lapsed; otherwise the upsert collides on _id
+        await db.leases.update_one(
+            {"_id": name, "$or": [{"holder": WORKER_ID}, {"expires_at": {"$lt": now}}]},
+            {"$set": {"holder": WORKER_ID, "expires_at": now + timedelta(seconds=ttl)}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        return False
+
+# Background prefetcher for trending titles
+async def prefetch_trending_titles() -> Dict[str, int]:
+    """Refresh cache entries for trending titles that are missing or about to expire"""
+    titles = await get_top_recent_titles(PREFETCH_TOP_TITLES, timedelta(hours=PREFETCH_HISTORY_HOURS))
+    budget = PREFETCH_CALL_BUDGET
+    stats = {"titles": len(titles), "tmdb_refreshed": 0, "streaming_refreshed": 0, "calls": 0}
+
+    # Titles arrive most popular first, so the budget goes to the hottest entries
+    for item in titles:
+        if budget <= 0:
+            break
+        key = (normalize_title(item["title"]), item["type"])
+
+        # A TMDB refresh is one search call
+        if await tmdb_cache.ttl_remaining(key) < PREFETCH_REFRESH_WINDOW:
+            await search_tmdb_content(item["title"], item["type"], use_cache=False)
+            budget -= 1
+            stats["tmdb_refreshed"] += 1
+
+        # A streaming refresh is a search call plus the multi-country show lookup
+        if budget >= 2 and await streaming_cache.ttl_remaining(key) < PREFETCH_REFRESH_WINDOW:
+            await get_streaming_availability(item["title"], item["type"], use_cache=False)
+            budget -= 2
+            stats["streaming_refreshed"] += 1
+
+    stats["calls"] = PREFETCH_CALL_BUDGET - budget
+    return stats
+
+async def prefetch_loop():
+    """Run the trending-title prefetcher every PREFETCH_INTERVAL seconds"""
+    while True:
+        await asyncio.sleep(PREFETCH_INTERVAL)
+        try:
+            # One worker refreshes the shared cache for all of them
+            if not await acquire_lease("prefetch", PREFETCH_INTERVAL * 2):
+                continue
+            stats = await prefetch_trending_titles()
+            print(f"Prefetch refreshed {stats['tmdb_refreshed']} TMDB and {stats['streaming_refreshed']} streaming entries "
+                  f"for {stats['titles']} trending titles using {stats['calls']} upstream calls")
+        except Exception as e:
+            print(f"Prefetch error: {e}")
+
+# Columnar archive of sessions and feedback
+def archive_str(value: Any) -> Optional[str]:
+    return None if value is None else str(value)
+
+def archive_number(value: Any, cast: Callable[[Any], Any]) -> Any:
+    """Coerce a loosely typed field to int or float, or None when it is not numeric"""
+    try:
+        return None if value is None or isinstance(value, bool) else cast(value)
+    except (TypeError, ValueError):
+        return None
+
+def flatten_session(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """One Parquet row per session; the embedded cards are reduced to id, title and type lists"""
+    usage = doc.get("llm_usage") or {}
+    recommendations = doc.get("recommendations") or []
+    return {
+        "session_id": archive_str(doc.get("session_id")),
+        "user_id": archive_str(doc.get("user_id")),
+        "mood_query": archive_str(doc.get("mood_query")),
+        "mood_interpretation": archive_str(doc.get("mood_interpretation")),
+        "country": archive_str(doc.get("country")),
+        "turn": archive_number(doc.get("turn"), int),
+        "degraded": bool(doc.get("degraded", False)),
+        "created_at": doc.get("created_at"),
+        "llm_model": archive_str(usage.get("model")),
+        "llm_parse": archive_str(usage.get("parse")),
+        "llm_hedged": None if usage.get("hedged") is None else bool(usage["hedged"]),
+        "llm_prompt_tokens": archive_number(usage.get("prompt_tokens"), int),
+        "llm_completion_tokens": archive_number(usage.get("completion_tokens"), int),
+        "llm_latency_ms": archive_number(usage.get("latency_ms"), float),
+        "recommendation_ids": [archive_str(rec.get("id")) for rec in recommendations],
+        "recommendation_titles": [archive_str(rec.get("title")) for rec in recommendations],
+        "recommendation_types": [archive_str(rec.get("type")) for rec in recommendations],
+    }
+
+def flatten_feedback(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Feedback bodies are free-form, so everything but the common keys is kept as a JSON string"""
+    payload = {key: value for key, value in doc.items() if key not in ("_id", "user_id", "session_id", "created_at")}
+    return {
+        "user_id": archive_str(doc.get("user_id")),
+        "session_id": archive_str(doc.get("session_id")),
+        "created_at": doc.get("created_at"),
+        "payload": orjson.dumps(payload, default=str).decode(),
+    }
+
+ARCHIVE_COLLECTIONS = {
+    "recommendations": flatten_session,
+    "feedback": flatten_feedback,
+}
+
+def archive_schema(name: str):
+    """Fixed column types so every part file in a partition has the same schema, even when a batch is all nulls"""
+    import pyarrow as pa
+
+    strings = pa.list_(pa.string())
+    if name == "recommendations":
+        return pa.schema([
+            ("session_id", pa.string()), ("user_id", pa.string()), ("mood_query", pa.string()),
+            ("mood_interpretation", pa.string()), ("country", pa.string()), ("turn", pa.int64()),
+            ("degraded", pa.bool_()), ("created_at", pa.timestamp("ms")), ("llm_model", pa.string()),
+            ("llm_parse", pa.string()), ("llm_hedged", pa.bool_()), ("llm_prompt_tokens", pa.int64()),
+            ("llm_completion_tokens", pa.int64()), ("llm_latency_ms", pa.float64()),
+            ("recommendation_ids", strings), ("recommendation_titles", strings), ("recommendation_types", strings),
+        ])
+    return pa.schema([
+        ("user_id", pa.string()), ("session_id", pa.string()), ("created_at", pa.timestamp("ms")), ("payload", pa.string()),
+    ])
+
+def write_parquet_part(name: str, rows: List[Dict[str, Any]], path: str) -> List[Dict[str, Any]]:
+    """Write one part file and return the rows pyarrow could not convert instead of failing the batch"""
+    import pandas as pd
+    import pyarrow as pa
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    schema = archive_schema(name)
+    try:
+        pd.DataFrame(rows).to_parquet(path, engine="pyarrow", index=False, schema=schema)
+        return []
+    except (pa.ArrowException, TypeError, ValueError):
+        pass
+    
+    import pyarrow.parquet as pq
+    
+    tables, rejected = [], []
+    for row in rows:
+        try:
+            tables.append(pa.Table.from_pylist([row], schema=schema))
+        except (pa.ArrowException, TypeError, ValueError):
+            rejected.append(row)
+    if tables:
+        pq.write_table(pa.concat_tables(tables), path)
+    return rejected
+
+def write_rejected_rows(rows: List[Any], path: str):
+    """Keep rows that could not be archived as JSON lines, so a bad document is set aside rather than lost"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "ab") as f:
+        for row in rows:
+            f.write(orjson.dumps(row, default=str) + b"\n")
+
+async def export_day(name: str, day_start: datetime) -> int:
+    """Stream one UTC day of a collection into date=YYYY-MM-DD/part-NNNNN.parquet files"""
+    flatten = ARCHIVE_COLLECTIONS[name]
+    partition_dir = os.path.join(ARCHIVE_DIR, name, f"date={day_start:%Y-%m-%d}")
+    # A rerun after a crash rewrites the whole partition
+    if os.path.isdir(partition_dir):
+        for filename in os.listdir(partition_dir):
+            os.remove(os.path.join(partition_dir, filename))
     
-    # Add Netflix as default if no specific matches and it's not already added
-    if not any(service["service"] == "Netflix" for service in mock_services):
-        mock_services.append({"service": "Netflix", "type": "subscription", "link": "https://netflix.com", "quality": "HD", "price": ""})
+    cursor = db[name].find(
+        {"created_at": {"$gte": day_start, "$lt": day_start + timedelta(days=1)}}
+    ).sort("created_at", 1).batch_size(ARCHIVE_BATCH_SIZE)
     
-    # Add Hulu for TV content
-    if content_type == "tv" and not any(service["service"] == "Hulu" for service in mock_services):
-        mock_services.append({"service": "Hulu", "type": "subscription", "link": "https://hulu.com", "quality": "HD", "price": ""})
+    rows, rejected, parts, total = [], [], 0, 0
+    
+    async def flush():
+        nonlocal rows, parts, total
+        unwritten = await asyncio.to_thread(write_parquet_part, name, rows, os.path.join(partition_dir, f"part-{parts:05d}.parquet"))
+        rejected.extend(unwritten)
+        parts, total, rows = parts + 1, total + len(rows) - len(unwritten), []
+    
+    # One malformed document must never pin the watermark while the TTL index keeps deleting later days
+    async for doc in cursor:
+        try:
+            rows.append(flatten(doc))
+        except Exception as e:
+            print(f"Archive could not flatten {name} document {doc.get('_id')}: {e}")
+            rejected.append(doc)
+        if len(rows) >= ARCHIVE_BATCH_SIZE:
+            await flush()
+    if rows:
+        await flush()
+    # Rejected rows live outside the dataset directory so readers of the parquet tree never see them
+    rejected_path = os.path.join(ARCHIVE_DIR, "_rejected", name, f"{day_start:%Y-%m-%d}.jsonl")
+    if os.path.exists(rejected_path):
+        os.remove(rejected_path)
+    if rejected:
+        await asyncio.to_thread(write_rejected_rows, rejected, rejected_path)
+        archive_state["rows_rejected"][name] = archive_state["rows_rejected"].get(name, 0) + len(rejected)
+        print(f"Archive kept {len(rejected)} unconvertible {name} rows in {rejected_path}")
+    return total
+
+async def export_archives() -> Dict[str, int]:
+    """Export every completed UTC day after each collection's watermark, oldest first"""
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    exported = {}
+    for name in ARCHIVE_COLLECTIONS:
+        state = await db.archive_state.find_one({"_id": name})
+        if state:
+            day = state["exported_through"]
+        else:
+            oldest = await db[name].find_one({}, sort=[("created_at", 1)], projection={"created_at": 1})
+            if not oldest:
+                continue
+            day = oldest["created_at"].replace(hour=0, minute=0, second=0, microsecond=0)
+        
+        exported[name] = 0
+        while day < today:
+            exported[name] += await export_day(name, day)
+            day += timedelta(days=1)
+            # The watermark only moves after the partition is fully written
+            await db.archive_state.update_one({"_id": name}, {"$set": {"exported_through": day}}, upsert=True)
+    return exported
+
+async def archive_loop():
+    """Export sessions and feedback to Parquet well before the TTL indexes delete them"""
+    while True:
+        try:
+            if not await acquire_lease("archive", ARCHIVE_INTERVAL * 2):
+                await asyncio.sleep(ARCHIVE_INTERVAL)
+                continue
+            exported = await export_archives()
+            archive_state.update(last_run=datetime.utcnow(), error=None)
+            for name, count in exported.items():
+                archive_state["rows_exported"][name] = archive_state["rows_exported"].get(name, 0) + count
+            if any(exported.values()):
+                print(f"Archived {exported} rows to {ARCHIVE_DIR}")
+        except Exception as e:
+            archive_state["error"] = str(e)
+            print(f"Archive export error: {e}")
+        await asyncio.sleep(ARCHIVE_INTERVAL)
+
+def resolve_country(mood_query: MoodQuery, request: HTTPConnection) -> str:
+    """Pick the streaming country from the query, edge geo headers, Accept-Language or the default"""
+    candidates = [mood_query.country] + [request.headers.get(header) for header in COUNTRY_HEADERS]
     
-    # Add rental option for movies
-    if content_type == "movie":
-        mock_services.append({"service": "Amazon Prime", "type": "rent", "link": "https://primevideo.com", "quality": "4K", "price": "$3.99"})
-        mock_services.append({"service": "Apple TV", "type": "rent", "link": "https://tv.apple.com", "quality": "4K", "price": "$4.99"})
+    # Accept-Language values such as "en-GB,en;q=0.9" carry a region in the first tag
+    language = request.headers.get("accept-language", "").split(",")[0].strip()
+    if "-" in language:
+        candidates.append(language.split("-")[1].split(";")[0])
     
-    return mock_services[:4]  # Return top 4 options
+    for candidate in candidates:
+        if candidate and COUNTRY_PATTERN.match(candidate.strip().lower()):
+            return candidate.strip().lower()
+    return DEFAULT_COUNTRY
 
 # API Routes
 @app.get("/api/health")
 async def health_check():
     return {"status": "healthy", "service": "Poppy AI Entertainment Discovery"}
 
+@app.get("/api/ready")
+async def readiness_check():
+    """Report whether this worker has finished warming up and can take traffic"""
+    payload = {
+        "ready": warmup_state["ready"],
+        "degraded": upstreams_degraded(),
+        "checks": warmup_state["checks"],
+        "warmup_ms": warmup_state["duration_ms"],
+        "import_ms": IMPORT_DURATION_MS
+    }
+    return FastJSONResponse(payload, status_code=200 if warmup_state["ready"] else 503)
+
+@app.get("/api/metrics")
+async def get_metrics():
+    """Expose LLM admission queue and token usage metrics"""
+    requests_count = llm_usage_stats["requests"]
+    return {
+        "llm_admission": llm_admission.metrics(),
+        "llm_router": llm_router.metrics(),
+        "upstreams": {name: health.status() for name, health in upstreams.items()},
+        "offline_catalog_titles": len(catalog.entries),
+        "archive": archive_state,
+        "worker_id": WORKER_ID,
+        "caches": {name: cache.metrics() for name, cache in tiered_caches.items()},
+        "llm_usage": {
+            **llm_usage_stats,
+            "total_latency_ms": round(llm_usage_stats["total_latency_ms"], 1),
+            "avg_latency_ms": round(llm_usage_stats["total_latency_ms"] / requests_count, 1) if requests_count else 0.0,
+            "avg_completion_tokens": round(llm_usage_stats["completion_tokens"] / requests_count, 1) if requests_count else 0.0
+        }
+    }
+
+async def run_recommendation_pipeline(
+    mood_query: MoodQuery,
+    country: str,
+    session_id: str,
+    on_interpretation: Optional[Callable[[str], Awaitable[None]]] = None,
+    on_recommendation: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None
+) -> Dict[str, Any]:
+    """Ask the LLM for picks, enrich them, store the session and return the response payload"""
+    priority = mood_query.priority if mood_query.priority in LLM_PRIORITIES else "interactive"
+    seen_filter, recent_titles = await load_seen_profile(mood_query.user_id)
+    
+    # Get LLM recommendations, or catalog picks while upstreams are down
+    degraded = upstreams_degraded()
+    if degraded:
+        llm_data, llm_usage = catalog_recommendations(mood_query.mood, seen_filter), None
+    else:
+        prompt = build_mood_prompt(mood_query.mood, recent_titles)
+        llm_data, llm_usage = await request_llm_recommendations(prompt, mood_query.mood, priority, session_id)
+        if llm_usage["parse"] == "fallback" and catalog.entries:
+            llm_data = catalog_recommendations(mood_query.mood, seen_filter)
+            degraded = True
+    if on_interpretation:
+        await on_interpretation(llm_data.get("mood_interpretation", ""))
+    
+    # Fetch additional data for each recommendation the user has not seen yet
+    recommendations = []
+    picks = filter_unseen(llm_data.get("recommendations", []), seen_filter)[:5]  # Limit to 5
+    for rec in picks:
+        recommendation = await enrich_recommendation(rec, country)
+        if recommendation:
+            recommendations.append(recommendation)
+            if on_recommendation:
+                await on_recommendation(recommendation)
+    
+    # The same recommendation dicts back both the stored session and the HTTP body
+    response_payload = {
+        "recommendations": recommendations,
+        "mood_interpretation": llm_data.get("mood_interpretation", ""),
+        "session_id": session_id,
+        "degraded": degraded
+    }
+    
+    # Store user query and recommendations in database
+    await db.recommendations.insert_one({
+        "session_id": session_id,
+        "user_id": mood_query.user_id,
+        "mood_query": mood_query.mood,
+        "mood_interpretation": response_payload["mood_interpretation"],
+        "country": country,
+        "recommendations": recommendations,
+        "llm_usage": llm_usage,
+        "degraded": degraded,
+        "created_at": datetime.utcnow()
+    })
+    await record_seen_titles(mood_query.user_id, seen_filter, recommendations, picks)
+    
+    return response_payload
+
 @app.post("/api/recommendations", response_model=RecommendationResponse)
-async def get_recommendations(mood_query: MoodQuery):
+async def get_recommendations(mood_query: MoodQuery, request: Request):
     """Get AI-powered entertainment recommendations based on user mood"""
     try:
         session_id = str(uuid.uuid4())
+        country = resolve_country(mood_query, request)
+        
+        response_payload = await run_recommendation_pipeline(mood_query, country, session_id)
+        
+        # Returning a response directly skips response_model re-validation
+        return FastJSONResponse(orjson.dumps(response_payload))
         
-        # Get LLM recommendations
-        chat = await get_recommendation_chat(session_id)
-        user_message = UserMessage(text=mood_query.mood)
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        print(f"Recommendation error: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to get recommendations: {str(e)}")
+
+# Async recommendation jobs
+def job_inflight_key(mood_query: MoodQuery, country: str) -> str:
+    """Key shared by one user's identical submissions so they attach to one job"""
+    # Results depend on the user's seen filter and are stored under their user_id, so users never share jobs
+    normalized = " ".join(mood_query.mood.lower().split())
+    return hashlib.sha256(f"{mood_query.user_id or ''}|{mood_query.priority}|{country}|{normalized}".encode()).hexdigest()
+
+def serialize_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "job_id": job["_id"],
+        "status": job["status"],
+        "session_id": job.get("session_id"),
+        "mood_interpretation": job.get("mood_interpretation"),
+        "recommendations": job.get("recommendations", []),
+        "error": job.get("error"),
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"]
+    }
+
+async def update_job(job_id: str, update: Dict[str, Any]):
+    update.setdefault("$set", {})["updated_at"] = datetime.utcnow()
+    await db.recommendation_jobs.update_one({"_id": job_id}, update)
+
+async def run_job(job_id: str):
+    """Run the recommendation pipeline for a job, saving partial results as they arrive"""
+    job = await db.recommendation_jobs.find_one({"_id": job_id})
+    if not job:
+        return
+    
+    await update_job(job_id, {"$set": {"status": "running"}})
+    try:
+        async def save_interpretation(mood_interpretation: str):
+            await update_job(job_id, {"$set": {"mood_interpretation": mood_interpretation}})
+        
+        async def save_recommendation(recommendation: Dict[str, Any]):
+            await update_job(job_id, {"$set": {"status": "partial"}, "$push": {"recommendations": recommendation}})
+        
+        await run_recommendation_pipeline(
+            MoodQuery(**job["request"]),
+            job["request"]["country"],
+            job["session_id"],
+            on_interpretation=save_interpretation,
+            on_recommendation=save_recommendation
+        )
+        await update_job(job_id, {"$set": {"status": "completed"}, "$unset": {"inflight_key": ""}})
+    except Exception as e:
+        print(f"Recommendation job {job_id} error: {e}")
+        await update_job(job_id, {"$set": {"status": "failed", "error": str(e)}, "$unset": {"inflight_key": ""}})
+
+async def job_heartbeat_loop():
+    """Mark this worker's queued and running jobs as alive, since the job queue lives in this process"""
+    while True:
+        try:
+            await db.recommendation_jobs.update_many(
+                {"worker_id": WORKER_ID, "inflight_key": {"$exists": True}},
+                {"$set": {"heartbeat_at": datetime.utcnow()}}
+            )
+        except Exception as e:
+            print(f"Job heartbeat error: {e}")
+        await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+
+async def release_stale_job(job: Dict[str, Any]) -> bool:
+    """Fail a job whose worker stopped sending heartbeats and free its inflight key"""
+    if job.get("heartbeat_at", job["updated_at"]) >= datetime.utcnow() - timedelta(seconds=JOB_STALE_AFTER):
+        return False
+    # Matching the old heartbeat keeps a concurrent release or a late heartbeat from being overwritten
+    result = await db.recommendation_jobs.update_one(
+        {"_id": job["_id"], "inflight_key": job.get("inflight_key"), "heartbeat_at": job.get("heartbeat_at")},
+        {"$set": {"status": "failed", "error": "Job worker stopped before finishing", "updated_at": datetime.utcnow()}, "$unset": {"inflight_key": ""}}
+    )
+    if result.modified_count:
+        print(f"Released stale recommendation job {job['_id']} from worker {job.get('worker_id')}")
+    return True
+
+async def job_worker():
+    """Pull job ids off the queue and run them until the app shuts down"""
+    while True:
+        job_id = await job_queue.get()
+        try:
+            await run_job(job_id)
+        except Exception as e:
+            print(f"Job worker error for {job_id}: {e}")
+        finally:
+            job_queue.task_done()
+
+@app.post("/api/recommendations/jobs", status_code=202)
+async def create_recommendation_job(mood_query: MoodQuery, request: Request):
+    """Start a recommendation job and return its id without waiting for the pipeline"""
+    from pymongo.errors import DuplicateKeyError
+    
+    try:
+        country = resolve_country(mood_query, request)
+        inflight_key = job_inflight_key(mood_query, country)
+        now = datetime.utcnow()
+        job = {
+            "_id": str(uuid.uuid4()),
+            "status": "queued",
+            "inflight_key": inflight_key,
+            "request": {**mood_query.model_dump(), "country": country},
+            "session_id": str(uuid.uuid4()),
+            "mood_interpretation": None,
+            "recommendations": [],
+            "error": None,
+            "worker_id": WORKER_ID,
+            "heartbeat_at": now,
+            "created_at": now,
+            "updated_at": now,
+            "expires_at": now + timedelta(seconds=JOB_TTL)
+        }
         
-        llm_response = await chat.send_message(user_message)
+        # A second attempt follows when the conflicting job turns out to belong to a dead worker
+        for attempt in range(2):
+            try:
+                await db.recommendation_jobs.insert_one(job)
+                break
+            except DuplicateKeyError:
+                existing = await db.recommendation_jobs.find_one({"inflight_key": inflight_key})
+                if existing and not await release_stale_job(existing):
+                    # The same request is already queued or running, so share its job
+                    return {**serialize_job(existing), "attached": True}
+                if attempt:
+                    raise
         
-        # Parse LLM response
         try:
-            # Clean the response to extract JSON
-            response_text = llm_response.strip()
-            if response_text.startswith("```json"):
-                response_text = response_text[7:]
-            if response_text.endswith("```"):
-                response_text = response_text[:-3]
+            job_queue.put_nowait(job["_id"])
+        except asyncio.QueueFull:
+            await db.recommendation_jobs.delete_one({"_id": job["_id"]})
+            raise HTTPException(status_code=503, detail="Job queue is full", headers={"Retry-After": str(llm_admission.retry_after())})
+        
+        return {**serialize_job(job), "attached": False}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to create recommendation job: {str(e)}")
+
+@app.get("/api/recommendations/jobs/{job_id}")
+async def get_recommendation_job(job_id: str, wait: float = 0, seen: int = -1):
+    """Return a job's partial or final results, long-polling up to `wait` seconds for news"""
+    try:
+        deadline = time.monotonic() + min(max(wait, 0), JOB_LONG_POLL_MAX)
+        while True:
+            job = await db.recommendation_jobs.find_one({"_id": job_id})
+            if not job:
+                raise HTTPException(status_code=404, detail="Job not found")
+            # Pollers can sit on any worker, so they fail a dead worker's job instead of waiting out JOB_TTL
+            if job["status"] not in ("completed", "failed") and await release_stale_job(job):
+                job = await db.recommendation_jobs.find_one({"_id": job_id})
+                if not job:
+                    raise HTTPException(status_code=404, detail="Job not found")
             
-            llm_data = json.loads(response_text)
-        except json.JSONDecodeError:
-            # Fallback if JSON parsing fails
-            llm_data = {
-                "mood_interpretation": f"I understand you're looking for something that matches your '{mood_query.mood}' vibe.",
-                "recommendations": [
-                    {"title": "The Grand Budapest Hotel", "type": "movie", "reason": "A whimsical, beautifully crafted film perfect for your mood."},
-                    {"title": "Avatar: The Last Airbender", "type": "tv", "reason": "An epic adventure with heart and stunning visuals."},
-                    {"title": "Spirited Away", "type": "movie", "reason": "A magical journey that captures wonder and emotion."},
-                    {"title": "Ted Lasso", "type": "tv", "reason": "Heartwarming comedy that lifts spirits and inspires."},
-                    {"title": "Your Name", "type": "movie", "reason": "A beautiful animated film about connection and fate."}
-                ]
+            # Return once the job is finished, has more cards than the client has seen, or time is up
+            finished = job["status"] in ("completed", "failed")
+            if finished or len(job.get("recommendations", [])) > seen or time.monotonic() >= deadline:
+                return serialize_job(job)
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get recommendation job: {str(e)}")
+
+@app.websocket("/api/ws/session")
+async def recommendation_session(websocket: WebSocket, session_id: Optional[str] = None, user_id: Optional[str] = None, country: Optional[str] = None):
+    """Refine a mood over several turns against one live LLM chat, pushing cards as they are enriched
+
+    The chat lives in the memory of the worker that opened it. With WEB_CONCURRENCY above 1 a resume
+    with ?session_id= only succeeds when the load balancer routes it to that worker (sticky routing,
+    e.g. hashing on the session_id query parameter); otherwise the client gets a fresh session marked
+    "resumed": false together with the id it asked for, and has to resend its mood.
+    """
+    await websocket.accept()
+    
+    try:
+        requested_session_id = session_id
+        session = chat_sessions.get(session_id) if session_id else None
+        resumed = session is not None
+        if session is None:
+            session_id = str(uuid.uuid4())
+            # Multi-turn chats stay on the primary backend from LLM_BACKENDS
+            backend = llm_router.backends[0]
+            session = {
+                "backend": backend,
+                "chat": await backend.open_chat(session_id),
+                "lock": asyncio.Lock(),
+                "turns": 0,
+                "user_id": user_id,
+                "country": resolve_country(MoodQuery(mood="", country=country), websocket)
             }
+            chat_sessions.set(session_id, session)
         
-        # Fetch additional data for each recommendation
-        recommendations = []
-        for rec in llm_data.get("recommendations", [])[:5]:  # Limit to 5
-            title = rec.get("title", "")
-            content_type = rec.get("type", "movie")
-            
-            # Search TMDB for metadata
-            tmdb_data = await search_tmdb_content(title, content_type)
-            
-            # Get streaming availability
-            streaming_info = await get_streaming_availability(title, content_type)
+        notice = {"type": "session", "session_id": session_id, "resumed": resumed, "turns": session["turns"], "worker_id": WORKER_ID}
+        if requested_session_id and not resumed:
+            notice["expired_session_id"] = requested_session_id
+            notice["detail"] = "Session not found on this worker; it expired or lives on another worker, so a new one was started"
+        await websocket.send_json(notice)
+        
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+            except json.JSONDecodeError:
+                message = {}
+            if not isinstance(message, dict):
+                message = {}
+            text = (message.get("mood") or message.get("refine") or message.get("message") or "").strip()
+            if not text:
+                await websocket.send_json({"type": "error", "detail": "Send {\"mood\": ...} to start or {\"refine\": ...} to adjust"})
+                continue
             
-            if tmdb_data:
-                # Get genre names
-                genre_names = get_genre_names(tmdb_data.get("genre_ids", []), content_type)
+            async with session["lock"]:
+                # Checked under the lock, since two connections can resume the same session
+                if session["turns"] >= CHAT_SESSION_MAX_TURNS:
+                    await websocket.send_json({"type": "error", "detail": "Session turn limit reached, please start a new session"})
+                    continue
                 
-                # Build poster and backdrop URLs
-                poster_url = None
-                backdrop_url = None
-                if tmdb_data.get("poster_path"):
-                    poster_url = f"https://image.tmdb.org/t/p/w500{tmdb_data['poster_path']}"
-                if tmdb_data.get("backdrop_path"):
-                    backdrop_url = f"https://image.tmdb.org/t/p/w1280{tmdb_data['backdrop_path']}"
+                seen_filter, recent_titles = await load_seen_profile(session["user_id"])
                 
-                recommendation = Recommendation(
-                    id=tmdb_data["id"],
-                    title=tmdb_data["title"],
-                    type=content_type,
-                    overview=tmdb_data["overview"],
-                    genre=genre_names,
-                    rating=tmdb_data["vote_average"],
-                    poster_url=poster_url,
-                    backdrop_url=backdrop_url,
-                    trailer_url=tmdb_data.get("trailer_url"),
-                    streaming_availability=streaming_info,
-                    recommendation_reason=rec.get("reason", "Perfect match for your current vibe!")
+                # The chat keeps prior turns, so refinements only send the delta
+                prompt = build_mood_prompt(text, recent_titles) if session["turns"] == 0 else (
+                    f"Refine your previous recommendations: {text}. Reply with 5 new recommendations in the same JSON format."
                 )
-                recommendations.append(recommendation)
-        
-        # Store user query and recommendations in database
-        await db.recommendations.insert_one({
-            "session_id": session_id,
-            "user_id": mood_query.user_id,
-            "mood_query": mood_query.mood,
-            "mood_interpretation": llm_data.get("mood_interpretation", ""),
-            "recommendations": [rec.dict() for rec in recommendations],
-            "created_at": datetime.utcnow()
-        })
-        
-        return RecommendationResponse(
-            recommendations=recommendations,
-            mood_interpretation=llm_data.get("mood_interpretation", ""),
-            session_id=session_id
-        )
-        
+                degraded = upstreams_degraded()
+                if degraded:
+                    llm_data, llm_usage = catalog_recommendations(text, seen_filter), None
+                else:
+                    try:
+                        llm_data, llm_usage = await request_llm_recommendations(prompt, text, "interactive", session_id, chat=session["chat"], backend=session["backend"])
+                    except AdmissionRejected as e:
+                        await websocket.send_json({"type": "error", "detail": str(e), "retry_after": e.retry_after})
+                        continue
+                    except Exception as e:
+                        # One failed turn must not drop the socket and its chat context; serve catalog picks like HTTP does
+                        print(f"Recommendation session LLM error: {e}")
+                        llm_data, llm_usage = catalog_recommendations(text, seen_filter), None
+                        degraded = True
+                    if llm_usage and llm_usage["parse"] == "fallback" and catalog.entries:
+                        llm_data = catalog_recommendations(text, seen_filter)
+                        degraded = True
+                
+                session["turns"] += 1
+                turn = session["turns"]
+                chat_sessions.set(session_id, session)
+                
+                await websocket.send_json({"type": "interpretation", "turn": turn, "mood_interpretation": llm_data.get("mood_interpretation", ""), "degraded": degraded})
+                
+                # Push each card as soon as its TMDB and streaming lookups finish
+                recommendations = []
+                picks = filter_unseen(llm_data.get("recommendations", []), seen_filter)[:5]
+                tasks = [enrich_recommendation(rec, session["country"]) for rec in picks]
+                for next_done in asyncio.as_completed(tasks):
+                    recommendation = await next_done
+                    if recommendation:
+                        recommendations.append(recommendation)
+                        await websocket.send_json({"type": "recommendation", "turn": turn, "recommendation": recommendation})
+                
+                await db.recommendations.insert_one({
+                    "session_id": session_id,
+                    "user_id": session["user_id"],
+                    "mood_query": text,
+                    "mood_interpretation": llm_data.get("mood_interpretation", ""),
+                    "country": session["country"],
+                    "turn": turn,
+                    "recommendations": recommendations,
+                    "llm_usage": llm_usage,
+                    "degraded": degraded,
+                    "created_at": datetime.utcnow()
+                })
+                await record_seen_titles(session["user_id"], seen_filter, recommendations, picks)
+                await websocket.send_json({"type": "done", "turn": turn, "count": len(recommendations)})
+    except WebSocketDisconnect:
+        pass
     except Exception as e:
-        print(f"Recommendation error: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to get recommendations: {str(e)}")
+        print(f"Recommendation session error: {e}")
+        await websocket.close(code=1011)
+
+@app.get("/api/content/{content_type}/{tmdb_id}")
+async def get_content_details(content_type: str, tmdb_id: str):
+    """Get trailer, cast, runtime and episode count for the details view"""
+    if content_type not in ("movie", "tv"):
+        raise HTTPException(status_code=400, detail="Content type must be 'movie' or 'tv'")
+    if not tmdb_id.isdigit():
+        raise HTTPException(status_code=400, detail="Invalid TMDB id")
+    
+    try:
+        details = await get_tmdb_details(content_type, tmdb_id)
+    except UpstreamUnavailable:
+        raise HTTPException(status_code=503, detail="TMDB is temporarily unavailable", headers={"Retry-After": str(UPSTREAM_COOLDOWN)})
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Failed to get content details: {str(e)}")
+    if details is None:
+        raise HTTPException(status_code=404, detail="Content not found")
+    
+    return FastJSONResponse(details, headers={"Cache-Control": f"public, max-age={TMDB_CACHE_TTL}"})
+
+@app.get("/api/images/{size}/{path}")
+async def get_image(size: str, path: str, request: Request):
+    """Serve a TMDB poster or backdrop through the local disk cache"""
+    if size not in IMAGE_SIZES:
+        raise HTTPException(status_code=400, detail=f"Unsupported image size '{size}'. Use one of: {', '.join(sorted(IMAGE_SIZES))}")
+    if not IMAGE_PATH_PATTERN.match(path):
+        raise HTTPException(status_code=400, detail="Invalid image path")
+
+    # TMDB file paths are content-addressed, so the bytes behind a URL never change
+    # and the ETag can come from the URL alone, answering revalidations without touching disk
+    etag = f'"{hashlib.sha256(f"{size}/{path}".encode()).hexdigest()[:32]}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=31536000, immutable",
+    }
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    data = await image_cache.fetch(size, path)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    media_type = mimetypes.guess_type(path)[0] or "image/jpeg"
+    return Response(content=data, media_type=media_type, headers=headers)
 
 @app.get("/api/recommendations/history")
-async def get_recommendation_history(user_id: Optional[str] = None, limit: int = 10):
+async def get_recommendation_history(request: Request, user_id: Optional[str] = None, limit: int = 10):
     """Get user's recommendation history"""
     try:
         query = {}
@@ -435,11 +2498,8 @@ async def get_recommendation_history(user_id: Optional[str] = None, limit: int =
         
         history = await db.recommendations.find(query).sort("created_at", -1).limit(limit).to_list(length=limit)
         
-        # Convert ObjectId to string for JSON serialization
-        for item in history:
-            item["_id"] = str(item["_id"])
-            
-        return {"history": history}
+        # ObjectId and datetime values are handled by orjson directly
+        return compressed_json_response(request, {"history": history})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get history: {str(e)}")
 
@@ -455,6 +2515,13 @@ async def submit_feedback(request: Request):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to submit feedback: {str(e)}")
 
+IMPORT_DURATION_MS = round((time.perf_counter() - IMPORT_STARTED_AT) * 1000, 1)
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    if SERVER_WORKERS > 1:
+        # Worker processes import the app themselves, so it is passed by name
+        print(f"Starting {SERVER_WORKERS} workers")
+        uvicorn.run("server:app", host="0.0.0.0", port=8001, workers=SERVER_WORKERS, app_dir=os.path.dirname(os.path.abspath(__file__)))
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
@@ -60,6 +60,22 @@ class PoppyAPITester:
             print(f"Health check response: {response}")
         return success
 
+    def test_ready_endpoint(self):
+        """Test the readiness endpoint reports a warmed-up worker"""
+        success, response = self.run_test(
+            "Readiness Endpoint",
+            "GET",
+            "api/ready",
+            200
+        )
+        if success:
+            if not response.get("ready"):
+                print("❌ Failed - Worker reported ready=false with status 200")
+                return False
+            for name, check in response.get("checks", {}).items():
+                print(f"{'✅' if check.get('ok') else '⚠️'} Warm-up step {name}: {check.get('detail')} ({check.get('duration_ms')} ms)")
+        return success
+
     def test_recommendations_endpoint(self, mood):
         """Test the recommendations endpoint with a mood query"""
         success, response = self.run_test(
@@ -229,12 +245,21 @@ class PoppyAPITester:
                         else:
                             print(f"⚠️ No poster image for '{rec['title']}'")
                         
-                        # Check for trailer URL
-                        if rec.get("trailer_url"):
-                            trailer_count += 1
-                            print(f"✅ Found trailer URL for '{rec['title']}': {rec['trailer_url'][:60]}...")
+                        # Trailers are loaded lazily from the content details endpoint
+                        if rec.get("details_url"):
+                            details_success, details = self.run_test(
+                                f"Content Details for '{rec['title']}'",
+                                "GET",
+                                rec["details_url"].lstrip("/"),
+                                200
+                            )
+                            if details_success and details.get("trailer_url"):
+                                trailer_count += 1
+                                print(f"✅ Found trailer URL for '{rec['title']}': {details['trailer_url'][:60]}...")
+                            else:
+                                print(f"⚠️ No trailer URL for '{rec['title']}'")
                         else:
-                            print(f"⚠️ No trailer URL for '{rec['title']}'")
+                            print(f"⚠️ No details URL for '{rec['title']}'")
                     
                     # Success if at least 50% of recommendations have posters and at least one has a trailer
                     if poster_count >= len(recommendations) / 2:
@@ -302,6 +327,131 @@ class PoppyAPITester:
             
         return success_count > 0  # Pass if at least one test case succeeds
 
+    def test_image_proxy(self):
+        """Test that poster images are served through the caching image proxy"""
+        success, response = self.run_test(
+            "Image Proxy Recommendations",
+            "POST",
+            "api/recommendations",
+            200,
+            data={"mood": "Disney animated movies for family night", "user_id": "test-user"}
+        )
+        
+        if not success or not response.get("recommendations"):
+            return False
+        
+        rec = next((r for r in response["recommendations"] if r.get("poster_url")), None)
+        if not rec:
+            print("❌ No proxied poster URL found in recommendations")
+            return False
+        
+        if not rec.get("poster_srcset"):
+            print(f"❌ Missing poster_srcset for '{rec['title']}'")
+            return False
+        print(f"✅ Poster srcset for '{rec['title']}': {rec['poster_srcset'][:80]}...")
+        
+        poster_url = rec["poster_url"]
+        if poster_url.startswith("/"):
+            poster_url = f"{self.base_url}{poster_url}"
+        
+        self.tests_run += 1
+        print(f"\n🔍 Testing image proxy fetch for {poster_url}...")
+        image_response = requests.get(poster_url)
+        etag = image_response.headers.get("ETag")
+        if image_response.status_code != 200 or not etag:
+            print(f"❌ Failed - Expected 200 with ETag, got {image_response.status_code}")
+            return False
+        if "max-age" not in image_response.headers.get("Cache-Control", ""):
+            print("❌ Failed - Missing long-lived Cache-Control header")
+            return False
+        self.tests_passed += 1
+        print(f"✅ Passed - {len(image_response.content)} bytes, ETag {etag}")
+        
+        self.tests_run += 1
+        print("\n🔍 Testing image proxy revalidation...")
+        revalidate_response = requests.get(poster_url, headers={"If-None-Match": etag})
+        if revalidate_response.status_code != 304:
+            print(f"❌ Failed - Expected 304, got {revalidate_response.status_code}")
+            return False
+        self.tests_passed += 1
+        print("✅ Passed - Status: 304")
+        
+        return True
+
+    def test_recommendation_jobs(self):
+        """Test the async recommendation job API with long-polling"""
+        success, response = self.run_test(
+            "Create Recommendation Job",
+            "POST",
+            "api/recommendations/jobs",
+            202,
+            data={"mood": "Something bittersweet for a quiet Sunday", "user_id": "test-user"}
+        )
+        
+        if not success:
+            return False
+        
+        job_id = response.get("job_id")
+        if not job_id:
+            print("❌ Failed - 'job_id' missing from response")
+            return False
+        print(f"✅ Job {job_id} created with status '{response.get('status')}'")
+        
+        seen = -1
+        for _ in range(10):
+            success, job = self.run_test(
+                f"Poll Recommendation Job {job_id}",
+                "GET",
+                f"api/recommendations/jobs/{job_id}?wait=10&seen={seen}",
+                200
+            )
+            if not success:
+                return False
+            
+            seen = len(job.get("recommendations", []))
+            print(f"Job status: {job['status']}, {seen} recommendations so far")
+            if job["status"] == "completed":
+                print(f"✅ Job completed with {seen} recommendations")
+                return seen > 0
+            if job["status"] == "failed":
+                print(f"❌ Job failed: {job.get('error')}")
+                return False
+        
+        print("❌ Job did not complete in time")
+        return False
+
+    def test_metrics_endpoint(self):
+        """Test that LLM admission metrics are exposed"""
+        success, response = self.run_test(
+            "Metrics Endpoint",
+            "GET",
+            "api/metrics",
+            200
+        )
+        
+        if success:
+            admission = response.get("llm_admission")
+            if not admission or "queue_depth" not in admission:
+                print("❌ Failed - 'llm_admission.queue_depth' missing from metrics")
+                return False
+            print(f"✅ LLM queue depth: {admission['queue_depth']}, active: {admission['active']}/{admission['max_concurrency']}")
+
+            upstreams = response.get("upstreams", {})
+            if set(upstreams) != {"llm", "tmdb", "streaming"}:
+                print("❌ Failed - upstream health missing from metrics")
+                return False
+            down = [name for name, status in upstreams.items() if status["down"]]
+            print(f"✅ Offline catalog: {response.get('offline_catalog_titles')} titles, upstreams down: {down or 'none'}")
+
+            caches = response.get("caches", {})
+            if not {"tmdb", "streaming", "llm"} <= set(caches):
+                print("❌ Failed - tiered cache metrics missing from metrics")
+                return False
+            for name, stats in caches.items():
+                print(f"✅ Cache {name}: L1 hit rate {stats['l1_hit_rate']}, L2 hit rate {stats['l2_hit_rate']} (worker {response.get('worker_id')})")
+
+        return success
+
     def test_history_endpoint(self):
         """Test the recommendations history endpoint"""
         success, response = self.run_test(
@@ -446,6 +596,9 @@ def run_tests():
     # Test health endpoint
     health_success = tester.test_health_endpoint()
     
+    # Test readiness endpoint
+    ready_success = tester.test_ready_endpoint()
+    
     # Test recommendations with different moods
     moods = [
         "I need something cozy for a rainy evening",
@@ -471,6 +624,15 @@ def run_tests():
     # Test genre-based pairings
     pairings_success = tester.test_genre_based_pairings()
     
+    # Test image proxy
+    image_proxy_success = tester.test_image_proxy()
+    
+    # Test async recommendation jobs
+    jobs_success = tester.test_recommendation_jobs()
+    
+    # Test metrics endpoint
+    metrics_success = tester.test_metrics_endpoint()
+    
     # Test history endpoint
     history_success = tester.test_history_endpoint()
     
@@ -486,11 +648,15 @@ def run_tests():
     print(f"Success rate: {(tester.tests_passed / tester.tests_run) * 100:.1f}%")
     print("\n📝 ENDPOINT STATUS:")
     print(f"Health Endpoint: {'✅ PASS' if health_success else '❌ FAIL'}")
+    print(f"Readiness Endpoint: {'✅ PASS' if ready_success else '❌ FAIL'}")
     print(f"Recommendations Endpoint: {'✅ PASS' if recommendations_success else '❌ FAIL'}")
     print(f"Content-Specific Streaming: {'✅ PASS' if content_specific_success else '❌ FAIL'}")
     print(f"Poster Images and Trailers: {'✅ PASS' if poster_trailer_success else '❌ FAIL'}")
     print(f"TMDB Metadata: {'✅ PASS' if tmdb_metadata_success else '❌ FAIL'}")
     print(f"Genre-Based Pairings: {'✅ PASS' if pairings_success else '❌ FAIL'}")
+    print(f"Image Proxy: {'✅ PASS' if image_proxy_success else '❌ FAIL'}")
+    print(f"Recommendation Jobs: {'✅ PASS' if jobs_success else '❌ FAIL'}")
+    print(f"Metrics Endpoint: {'✅ PASS' if metrics_success else '❌ FAIL'}")
     print(f"History Endpoint: {'✅ PASS' if history_success else '❌ FAIL'}")
     print(f"Feedback Endpoint: {'✅ PASS' if feedback_success else '❌ FAIL'}")
     print("=" * 50)
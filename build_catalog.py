@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Refresh Poppy's offline catalog snapshot from TMDB, the streaming API and recent recommendation history
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta
+
+import orjson
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+import server  # noqa: E402
+
+
+def load_snapshot(path):
+    try:
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
+    except FileNotFoundError:
+        return {"version": 1, "generated_at": None, "entries": []}
+
+
+def genre_mood_tags(genre_ids, content_type):
+    names = server.get_genre_names(genre_ids, content_type)
+    return sorted({server.GENRE_MOOD_TAGS[name] for name in names if name in server.GENRE_MOOD_TAGS})
+
+
+async def add_history_titles(entries, history_days, limit):
+    """Append the most recommended titles from recent sessions that the snapshot does not cover yet"""
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    server.client = AsyncIOMotorClient(server.MONGO_URL)
+    server.db = server.client[server.DB_NAME]
+    try:
+        known = {(server.normalize_title(entry["title"]), entry["type"]) for entry in entries}
+        for row in await server.get_top_recent_titles(limit, timedelta(days=history_days)):
+            if (server.normalize_title(row["title"]), row["type"]) not in known:
+                entries.append({"title": row["title"], "type": row["type"], "mood_tags": [], "streaming": {}})
+    finally:
+        server.client.close()
+
+
+async def refresh_entry(entry):
+    """Fill in TMDB metadata and the all-country streaming map; keep the old values when an upstream fails"""
+    tmdb_data = await server.fetch_tmdb_search(entry["title"], entry["type"])
+    if tmdb_data:
+        entry.update({
+            "id": tmdb_data["id"],
+            "overview": tmdb_data["overview"],
+            "genre_ids": tmdb_data["genre_ids"],
+            "vote_average": tmdb_data["vote_average"],
+            "poster_path": tmdb_data["poster_path"],
+            "backdrop_path": tmdb_data["backdrop_path"],
+        })
+        if tmdb_data.get("release_date"):
+            entry["year"] = int(tmdb_data["release_date"][:4])
+        if not entry.get("mood_tags"):
+            entry["mood_tags"] = genre_mood_tags(entry["genre_ids"], entry["type"])
+
+    streaming_options, complete = await server.fetch_streaming_options(entry["title"], entry["type"])
+    # A partial map only covers the default country and would hide availability elsewhere
+    if streaming_options is not None and complete:
+        entry["streaming"] = streaming_options
+    return tmdb_data is not None
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--path", default=server.CATALOG_SNAPSHOT_PATH)
+    parser.add_argument("--history-days", type=int, default=0, help="also add top titles recommended in the last N days")
+    parser.add_argument("--history-limit", type=int, default=50)
+    args = parser.parse_args()
+
+    snapshot = load_snapshot(args.path)
+    entries = snapshot["entries"]
+    if args.history_days:
+        await add_history_titles(entries, args.history_days, args.history_limit)
+
+    refreshed = 0
+    for entry in entries:
+        refreshed += await refresh_entry(entry)
+
+    # Entries that never resolved to a TMDB id cannot link to the details endpoint
+    snapshot["entries"] = [entry for entry in entries if entry.get("id")]
+    snapshot["generated_at"] = datetime.utcnow().isoformat() + "Z"
+    with open(args.path, "wb") as f:
+        f.write(orjson.dumps(snapshot, option=orjson.OPT_INDENT_2))
+    print(f"Wrote {len(snapshot['entries'])} titles to {args.path} ({refreshed} refreshed from TMDB)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -35,7 +35,8 @@ const App = () => {
       
       const response = await axios.post(`${API_BASE_URL}/api/recommendations`, {
         mood: remixPrompt,
-        user_id: 'demo-user'
+        user_id: 'demo-user',
+        priority: 'remix'
       });
       
       if (response.data.recommendations && response.data.recommendations.length > 0) {
@@ -151,8 +152,25 @@ const App = () => {
     };
   };
 
-  const handleDetailsClick = (recommendation) => {
+  // Trailer, cast, runtime and episode count are fetched only when a user asks for them
+  const loadContentDetails = async (recommendation) => {
+    if (!recommendation.details_url || recommendation.detailsLoaded) {
+      return recommendation;
+    }
+    const response = await axios.get(`${API_BASE_URL}${recommendation.details_url}`);
+    const detailed = { ...recommendation, ...response.data, id: recommendation.id, detailsLoaded: true };
+    setRecommendations(prev => prev.map(rec => (rec.id === recommendation.id ? detailed : rec)));
+    return detailed;
+  };
+
+  const handleDetailsClick = async (recommendation) => {
     setSelectedDetails(recommendation);
+    try {
+      const detailed = await loadContentDetails(recommendation);
+      setSelectedDetails(current => (current && current.id === recommendation.id ? detailed : current));
+    } catch (err) {
+      console.error('Error fetching content details:', err);
+    }
   };
 
   const closeDetails = () => {
@@ -187,6 +205,24 @@ const App = () => {
     }
   };
 
+  const handleCardTrailerClick = async (recommendation) => {
+    if (recommendation.trailer_url) {
+      handleTrailerClick(recommendation.trailer_url, recommendation.title);
+      return;
+    }
+
+    // Open the tab before awaiting so the browser does not treat it as a popup
+    const trailerWindow = window.open('', '_blank');
+    let trailerUrl = null;
+    try {
+      trailerUrl = (await loadContentDetails(recommendation)).trailer_url;
+    } catch (err) {
+      console.error('Error fetching trailer:', err);
+    }
+    const searchQuery = encodeURIComponent(`${recommendation.title} trailer`);
+    trailerWindow.location.href = trailerUrl || `https://www.youtube.com/results?search_query=${searchQuery}`;
+  };
+
   const toggleStreamingOptions = (recId) => {
     setExpandedStreaming(prev => ({
       ...prev,
@@ -359,6 +395,8 @@ const App = () => {
                     {rec.poster_url ? (
                       <img
                         src={rec.poster_url}
+                        srcSet={rec.poster_srcset || undefined}
+                        sizes="(min-width: 1024px) 33vw, (min-width: 768px) 50vw, 100vw"
                         alt={rec.title}
                         className="w-full h-full object-cover"
                         onError={(e) => {
@@ -392,10 +430,10 @@ const App = () => {
                       </div>
                       
                       {/* Trailer button overlay */}
-                      {rec.trailer_url && (
+                      {(rec.trailer_url || rec.details_url) && (
                         <div className="absolute bottom-4 right-4">
                           <button
-                            onClick={() => handleTrailerClick(rec.trailer_url, rec.title)}
+                            onClick={() => handleCardTrailerClick(rec)}
                             className="bg-red-600/90 hover:bg-red-600 text-white rounded-full p-3 shadow-lg transform hover:scale-110 transition-all duration-200"
                             title="Watch Trailer"
                           >
@@ -521,9 +559,9 @@ const App = () => {
                       
                       {/* Secondary actions */}
                       <div className="flex space-x-2">
-                        {rec.trailer_url && (
+                        {(rec.trailer_url || rec.details_url) && (
                           <button 
-                            onClick={() => handleTrailerClick(rec.trailer_url, rec.title)}
+                            onClick={() => handleCardTrailerClick(rec)}
                             className="flex-1 bg-red-600/20 hover:bg-red-600/30 text-red-200 border border-red-500/50 hover:border-red-400/70 rounded-lg py-2 px-4 text-sm font-medium transition-all duration-200 flex items-center justify-center space-x-1"
                           >
                             <span>🎥</span>
@@ -597,6 +635,8 @@ const App = () => {
                       {selectedDetails.poster_url ? (
                         <img
                           src={selectedDetails.poster_url}
+                          srcSet={selectedDetails.poster_srcset || undefined}
+                          sizes="192px"
                           alt={selectedDetails.title}
                           className="w-full h-full object-cover"
                         />
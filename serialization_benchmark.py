@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for Poppy's response serialization path
+"""
+
+import gzip
+import json
+import os
+import sys
+import timeit
+from datetime import datetime
+
+import orjson
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from server import Recommendation, RecommendationResponse, build_recommendation  # noqa: E402
+
+ITERATIONS = 2000
+
+TMDB_DATA = {
+    "id": "550",
+    "title": "Fight Club",
+    "overview": "A ticking-time-bomb insomniac and a slippery soap salesman channel primal male aggression into a shocking new form of therapy.",
+    "genre_ids": [18, 53, 35],
+    "vote_average": 8.4,
+    "poster_path": "/pB8BM7pdSp6B6Ih7QZ4DrQ3PmJK.jpg",
+    "backdrop_path": "/hZkgoQYus5vegHoetLkCJzb17zJ.jpg",
+    "trailer_url": "https://www.youtube.com/watch?v=qtRKdVHc-cE",
+}
+
+STREAMING_INFO = [
+    {"service": "Netflix", "type": "subscription", "link": "https://netflix.com", "quality": "4K", "price": ""},
+    {"service": "Apple TV", "type": "rent", "link": "https://tv.apple.com", "quality": "4K", "price": "$4.99"},
+]
+
+REASON = "Dark, twisty and perfect for a restless late-night mood."
+
+
+def legacy_recommendations():
+    """Previous path: build models, dump them for Mongo, then validate and encode the response"""
+    recommendations = []
+    for _ in range(5):
+        fields = build_recommendation(TMDB_DATA, "movie", STREAMING_INFO, REASON)
+        recommendations.append(Recommendation(**fields))
+    stored = [rec.model_dump() for rec in recommendations]
+    response = RecommendationResponse(recommendations=recommendations, mood_interpretation="Moody", session_id="s")
+    validated = RecommendationResponse.model_validate(response.model_dump())
+    return stored, json.dumps(jsonable_encoder(validated)).encode()
+
+
+def single_pass_recommendations():
+    """Current path: build dicts once and serialize them once with orjson"""
+    recommendations = [build_recommendation(TMDB_DATA, "movie", STREAMING_INFO, REASON) for _ in range(5)]
+    payload = {"recommendations": recommendations, "mood_interpretation": "Moody", "session_id": "s"}
+    return recommendations, orjson.dumps(payload)
+
+
+def history_documents(count=10):
+    recommendations = [build_recommendation(TMDB_DATA, "movie", STREAMING_INFO, REASON) for _ in range(5)]
+    return [
+        {
+            "_id": ObjectId(),
+            "session_id": f"session-{i}",
+            "user_id": "bench-user",
+            "mood_query": "something cozy",
+            "mood_interpretation": "Moody",
+            "recommendations": recommendations,
+            "created_at": datetime.utcnow(),
+        }
+        for i in range(count)
+    ]
+
+
+def legacy_history(history):
+    for item in history:
+        item["_id"] = str(item["_id"])
+    return json.dumps(jsonable_encoder({"history": history})).encode()
+
+
+def orjson_history(history):
+    return orjson.dumps({"history": history}, default=str)
+
+
+def report(name, legacy, current):
+    legacy_time = timeit.timeit(legacy, number=ITERATIONS) / ITERATIONS * 1e6
+    current_time = timeit.timeit(current, number=ITERATIONS) / ITERATIONS * 1e6
+    print(f"{name}:")
+    print(f"  legacy:  {legacy_time:8.1f} µs/request")
+    print(f"  current: {current_time:8.1f} µs/request ({legacy_time / current_time:.1f}x faster)")
+
+
+def run_benchmarks():
+    print("=" * 50)
+    print("⏱️  POPPY SERIALIZATION BENCHMARKS ⏱️")
+    print("=" * 50)
+
+    report("Recommendation response", legacy_recommendations, single_pass_recommendations)
+
+    legacy_docs = history_documents()
+    current_docs = history_documents()
+    report("History response (10 sessions)", lambda: legacy_history(legacy_docs), lambda: orjson_history(current_docs))
+
+    body = orjson_history(current_docs)
+    print(f"History payload: {len(body)} bytes raw, {len(gzip.compress(body, compresslevel=5))} bytes gzip")
+
+
+if __name__ == "__main__":
+    run_benchmarks()
@@ -0,0 +1,118 @@
+"""
+Unit tests for LLM admission control: priority order, queue bound and slot hand-over on cancellation
+"""
+
+import asyncio
+
+import pytest
+
+import server
+
+
+async def settle():
+    # Let queued acquire() calls reach their await
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+async def waiter(controller, priority, admitted):
+    await controller.acquire(priority)
+    admitted.append(priority)
+
+
+def test_interactive_waiters_go_before_remix_and_batch():
+    async def scenario():
+        controller = server.AdmissionController(1, 10)
+        await controller.acquire("interactive")
+        admitted = []
+        tasks = []
+        for priority in ("batch", "remix", "batch", "interactive", "remix", "interactive"):
+            tasks.append(asyncio.create_task(waiter(controller, priority, admitted)))
+            await settle()
+        assert controller.queue_depth() == 6
+
+        for _ in tasks:
+            controller.release()
+            await settle()
+        await asyncio.wait_for(asyncio.gather(*tasks), 1)
+        return admitted, controller
+
+    admitted, controller = asyncio.run(scenario())
+    assert admitted == ["interactive", "interactive", "remix", "remix", "batch", "batch"]
+    assert controller.active == 1
+    assert controller.stats["batch"]["queued"] == 2
+
+
+def test_full_queue_rejects_with_retry_after():
+    async def scenario():
+        controller = server.AdmissionController(1, 2)
+        controller.avg_service_seconds = 2.0
+        await controller.acquire("interactive")
+        tasks = [asyncio.create_task(controller.acquire("remix")) for _ in range(2)]
+        await settle()
+        with pytest.raises(server.AdmissionRejected) as rejected:
+            await controller.acquire("interactive")
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return rejected.value, controller
+
+    rejected, controller = asyncio.run(scenario())
+    # Two queued plus the caller, one slot, two seconds each
+    assert rejected.retry_after == 6
+    assert "retry after 6s" in str(rejected)
+    assert controller.stats["interactive"]["rejected"] == 1
+
+
+def test_cancelled_waiter_passes_a_handed_over_slot_on():
+    async def scenario():
+        controller = server.AdmissionController(1, 10)
+        await controller.acquire("interactive")
+        admitted = []
+        first = asyncio.create_task(waiter(controller, "interactive", admitted))
+        second = asyncio.create_task(waiter(controller, "batch", admitted))
+        await settle()
+
+        # The slot is handed to the first waiter, which is cancelled before it gets to run
+        controller.release()
+        first.cancel()
+        await settle()
+        # Without the hand-over the second waiter would wait forever
+        await asyncio.wait_for(second, 1)
+        return admitted, first, controller
+
+    admitted, first, controller = asyncio.run(scenario())
+    assert first.cancelled()
+    assert admitted == ["batch"]
+    assert controller.active == 1
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        controller = server.AdmissionController(1, 10)
+        await controller.acquire("interactive")
+        task = asyncio.create_task(controller.acquire("remix"))
+        await settle()
+        task.cancel()
+        await settle()
+        depth = controller.queue_depth()
+        controller.release()
+        return depth, controller
+
+    depth, controller = asyncio.run(scenario())
+    assert depth == 0
+    assert controller.active == 0
+
+
+def test_slot_is_released_when_the_block_raises():
+    async def scenario():
+        controller = server.AdmissionController(1, 0)
+        with pytest.raises(RuntimeError):
+            async with controller.slot("interactive"):
+                raise RuntimeError("llm failed")
+        # With no queue a leaked slot would make this raise AdmissionRejected
+        async with controller.slot("interactive"):
+            pass
+        return controller
+
+    assert asyncio.run(scenario()).active == 0
@@ -0,0 +1,70 @@
+"""
+Unit tests for the tolerant LLM reply parser
+"""
+
+import json
+
+import server
+
+PAYLOAD = {
+    "mood_interpretation": "Something warm and funny",
+    "recommendations": [
+        {"title": "Paddington 2", "type": "movie", "reason": "Pure comfort."},
+        {"title": "Ted Lasso", "type": "series", "reason": "Kindness with jokes."},
+    ],
+}
+
+
+def test_extract_plain_json():
+    assert server.extract_json_object(json.dumps(PAYLOAD)) == PAYLOAD
+
+
+def test_extract_fenced_reply():
+    reply = f"```json\n{json.dumps(PAYLOAD, indent=2)}\n```"
+    assert server.extract_json_object(reply) == PAYLOAD
+
+
+def test_extract_prose_wrapped_reply():
+    reply = f"Sure! Here are some picks for you:\n{json.dumps(PAYLOAD)}\nEnjoy your night in."
+    assert server.extract_json_object(reply) == PAYLOAD
+
+
+def test_extract_skips_stray_brace_before_object():
+    reply = f"Note: {{ this is not JSON. {json.dumps(PAYLOAD)}"
+    assert server.extract_json_object(reply) == PAYLOAD
+
+
+def test_extract_rejects_non_dict_json():
+    assert server.extract_json_object(json.dumps(PAYLOAD["recommendations"])) is None
+    assert server.extract_json_object('"just a string"') is None
+    assert server.extract_json_object("no json here") is None
+
+
+def test_validate_normalizes_items():
+    data = server.validate_llm_payload({
+        "recommendations": [
+            {"title": "  Dark  ", "type": "Show"},
+            {"title": "", "type": "movie"},
+            {"type": "movie"},
+            "Heat",
+            {"title": "Heat", "type": "film", "reason": None},
+        ]
+    })
+    assert data["mood_interpretation"] == ""
+    assert [(item["title"], item["type"]) for item in data["recommendations"]] == [("Dark", "tv"), ("Heat", "movie")]
+    assert all(item["reason"] for item in data["recommendations"])
+
+
+def test_validate_rejects_unusable_payloads():
+    assert server.validate_llm_payload(None) is None
+    assert server.validate_llm_payload([PAYLOAD]) is None
+    assert server.validate_llm_payload({"recommendations": "Heat"}) is None
+    assert server.validate_llm_payload({"recommendations": [{"title": " "}]}) is None
+
+
+def test_parse_reports_mode():
+    assert server.parse_llm_recommendations(json.dumps(PAYLOAD), "cozy")[1] == "json"
+    assert server.parse_llm_recommendations(f"Here you go: {json.dumps(PAYLOAD)}", "cozy")[1] == "recovered"
+    data, mode = server.parse_llm_recommendations("I cannot help with that.", "cozy")
+    assert mode == "fallback"
+    assert data["recommendations"]
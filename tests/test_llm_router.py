@@ -0,0 +1,96 @@
+"""
+Unit tests for the hedging LLM router, run against local stub backends
+"""
+
+import asyncio
+import json
+import time
+
+import pytest
+
+import server
+
+VALID_REPLY = json.dumps({
+    "mood_interpretation": "stub",
+    "recommendations": [{"title": "Heat", "type": "movie", "reason": "Tense."}],
+})
+
+
+@pytest.fixture(autouse=True)
+def short_hedge_delay(monkeypatch):
+    # Too few samples for a p95, so the router uses LLM_HEDGE_DELAY
+    monkeypatch.setattr(server, "LLM_HEDGE_DELAY", 0.05)
+    monkeypatch.setattr(server, "LLM_HEDGE_MIN", 0.01)
+
+
+async def route(router):
+    result = await router.route("session", "cozy prompt", "cozy")
+    # Let cancelled losers observe their cancellation before stats are checked
+    await asyncio.sleep(0.01)
+    return result
+
+
+def test_primary_answers_without_hedging():
+    router = server.LlmRouter([
+        server.StubLlmBackend("primary", 0.0, VALID_REPLY),
+        server.StubLlmBackend("backup", 0.0, VALID_REPLY),
+    ])
+    result = asyncio.run(route(router))
+    assert result["backend"] == "primary"
+    assert result["hedged"] is False
+    assert router.stats["backup"]["requests"] == 0
+
+
+def test_hedges_after_delay_and_cancels_loser():
+    router = server.LlmRouter([
+        server.StubLlmBackend("primary", 1.0, VALID_REPLY),
+        server.StubLlmBackend("backup", 0.01, VALID_REPLY),
+    ])
+    started = time.perf_counter()
+    result = asyncio.run(route(router))
+    assert time.perf_counter() - started < 0.5
+    assert result["backend"] == "backup"
+    assert result["hedged"] is True
+    assert router.stats["backup"]["wins"] == 1
+    assert router.stats["primary"]["cancelled"] == 1
+
+
+def test_fails_over_on_invalid_reply():
+    router = server.LlmRouter([
+        server.StubLlmBackend("primary", 0.0, "Sorry, I can't recommend anything."),
+        server.StubLlmBackend("backup", 0.0, VALID_REPLY),
+    ])
+    result = asyncio.run(route(router))
+    assert result["backend"] == "backup"
+    assert result["parse"] == "json"
+    assert router.stats["primary"]["invalid"] == 1
+
+
+def test_falls_back_when_every_backend_fails():
+    router = server.LlmRouter([
+        server.StubLlmBackend("primary", 0.0, "nope"),
+        server.StubLlmBackend("backup", 0.0, "still nope"),
+    ])
+    result = asyncio.run(route(router))
+    assert result["backend"] is None
+    assert result["parse"] == "fallback"
+    assert result["llm_data"]["recommendations"]
+
+
+def test_hedge_takes_its_own_admission_slot():
+    async def scenario(max_concurrency):
+        admission = server.AdmissionController(max_concurrency, 10)
+        router = server.LlmRouter([
+            server.StubLlmBackend("primary", 0.2, VALID_REPLY),
+            server.StubLlmBackend("backup", 0.01, VALID_REPLY),
+        ], admission)
+        async with admission.slot():
+            result = await route(router)
+            assert admission.active == 1
+        return result
+
+    # A free slot lets the hedge run; without one the router keeps waiting on the primary
+    assert asyncio.run(scenario(2))["backend"] == "backup"
+    result = asyncio.run(scenario(1))
+    assert result["backend"] == "primary"
+    assert result["hedged"] is False
@@ -0,0 +1,69 @@
+"""
+Unit tests for the per-user seen-titles Bloom filter: false-positive rate at capacity and generation rotation
+"""
+
+import server
+
+PROBES = 20000
+
+
+def false_positive_rate(seen_filter):
+    hits = sum(seen_filter.contains(f"Never Shown {i}", "movie") for i in range(PROBES))
+    return hits / PROBES
+
+
+def test_sized_from_capacity_and_error_rate():
+    seen_filter = server.SeenTitlesFilter(capacity=1000, error_rate=0.01)
+    # m = -n ln p / (ln 2)^2 is about 9.6 bits per title, with 7 hashes
+    assert 9585 <= seen_filter.bits <= 9600
+    assert seen_filter.hashes == 7
+
+
+def test_false_positive_rate_at_capacity():
+    seen_filter = server.SeenTitlesFilter(capacity=1000, error_rate=0.01)
+    for i in range(999):
+        seen_filter.add(f"Shown {i}", "movie")
+    assert seen_filter.count == 999
+    assert all(seen_filter.contains(f"Shown {i}", "movie") for i in range(999))
+    assert false_positive_rate(seen_filter) < 0.015
+
+
+def test_rotation_bounds_false_positives_for_long_histories():
+    seen_filter = server.SeenTitlesFilter(capacity=1000, error_rate=0.01)
+    # A single fixed-size filter would be saturated after this many titles
+    for i in range(10000):
+        seen_filter.add(f"Shown {i}", "movie")
+    # Two full generations at 1% each
+    assert false_positive_rate(seen_filter) < 0.025
+    # The most recent generation is always remembered, the oldest titles are forgotten
+    assert all(seen_filter.contains(f"Shown {i}", "movie") for i in range(9000, 10000))
+    assert sum(seen_filter.contains(f"Shown {i}", "movie") for i in range(1000)) < 50
+
+
+def test_merge_counts_titles_and_rotates():
+    stored = server.SeenTitlesFilter(capacity=30, error_rate=0.01)
+    for i in range(25):
+        stored.add(f"Old {i}", "tv")
+    session = server.SeenTitlesFilter(capacity=30, error_rate=0.01)
+    for i in range(10):
+        session.add(f"New {i}", "tv")
+
+    stored.merge(session)
+    assert stored.count == 0
+    assert all(stored.contains(f"New {i}", "tv") for i in range(10))
+    assert all(stored.contains(f"Old {i}", "tv") for i in range(25))
+
+
+def test_profile_round_trip_keeps_both_generations():
+    seen_filter = server.SeenTitlesFilter()
+    for i in range(server.SEEN_FILTER_CAPACITY + 5):
+        seen_filter.add(f"Shown {i}", "movie")
+    restored = server.SeenTitlesFilter.from_profile(seen_filter.to_fields())
+    assert restored.count == 5
+    assert all(restored.contains(f"Shown {i}", "movie") for i in range(server.SEEN_FILTER_CAPACITY + 5))
+
+
+def test_stored_filter_of_another_size_starts_over():
+    restored = server.SeenTitlesFilter.from_profile({"seen_filter": b"\xff" * 1024, "seen_filter_count": 400})
+    assert restored.count == 0
+    assert not restored.contains("Anything", "movie")
@@ -0,0 +1,119 @@
+"""
+Unit tests for the keyword streaming fallback: parity with the original hard-coded rules and hot reload
+"""
+
+import itertools
+import os
+import random
+import shutil
+
+import orjson
+import pytest
+
+import server
+
+
+def baseline_mock_services(title, content_type="movie"):
+    """The hard-coded rules mock_streaming_services replaced, kept here as the reference behaviour"""
+    services = []
+    title_lower = title.lower()
+    if any(word in title_lower for word in ["disney", "pixar", "marvel", "star wars", "moana", "frozen", "toy story", "coco", "encanto", "lion king"]):
+        services.append({"service": "Disney+", "type": "subscription", "link": "https://disneyplus.com", "quality": "4K", "price": ""})
+    if any(word in title_lower for word in ["netflix", "stranger things", "the crown", "wednesday", "squid game", "dark", "money heist"]):
+        services.append({"service": "Netflix", "type": "subscription", "link": "https://netflix.com", "quality": "4K", "price": ""})
+    elif content_type == "tv":
+        services.append({"service": "Netflix", "type": "subscription", "link": "https://netflix.com", "quality": "4K", "price": ""})
+    if any(word in title_lower for word in ["hbo", "game of thrones", "succession", "euphoria", "house of dragon", "last of us"]):
+        services.append({"service": "HBO Max", "type": "subscription", "link": "https://hbomax.com", "quality": "4K", "price": ""})
+    if any(word in title_lower for word in ["amazon", "prime", "rings of power", "boys", "marvelous", "grand tour"]):
+        services.append({"service": "Prime Video", "type": "subscription", "link": "https://primevideo.com", "quality": "4K", "price": ""})
+    if not any(service["service"] == "Netflix" for service in services):
+        services.append({"service": "Netflix", "type": "subscription", "link": "https://netflix.com", "quality": "HD", "price": ""})
+    if content_type == "tv" and not any(service["service"] == "Hulu" for service in services):
+        services.append({"service": "Hulu", "type": "subscription", "link": "https://hulu.com", "quality": "HD", "price": ""})
+    if content_type == "movie":
+        services.append({"service": "Amazon Prime", "type": "rent", "link": "https://primevideo.com", "quality": "4K", "price": "$3.99"})
+        services.append({"service": "Apple TV", "type": "rent", "link": "https://tv.apple.com", "quality": "4K", "price": "$4.99"})
+    return services[:4]
+
+
+TITLES = [
+    "Toy Story 3",
+    "Frozen II",
+    "Star Wars: The Empire Strikes Back",
+    "The Marvelous Mrs. Maisel",
+    "Marvel's Daredevil",
+    "The Last of Us",
+    "Game of Thrones",
+    "The Boys",
+    "Stranger Things",
+    "Dark",
+    "The Grand Tour",
+    "Squid Game",
+    "Disney's Hocus Pocus HBO Prime",
+    "Paddington 2",
+    "",
+]
+
+
+@pytest.fixture
+def rules(tmp_path, monkeypatch):
+    """A private copy of the rules file, rechecked on every call"""
+    path = tmp_path / "streaming_rules.json"
+    shutil.copy(server.STREAMING_RULES_PATH, path)
+    monkeypatch.setattr(server, "STREAMING_RULES_CHECK_INTERVAL", 0)
+    rules = server.StreamingRules(str(path))
+    monkeypatch.setattr(server, "streaming_rules", rules)
+    return path
+
+
+def rewrite(path, change):
+    data = orjson.loads(path.read_bytes())
+    change(data)
+    path.write_bytes(orjson.dumps(data))
+    # Some filesystems keep mtime at one-second resolution, so bump it explicitly
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+
+
+@pytest.mark.parametrize("content_type", ["movie", "tv"])
+@pytest.mark.parametrize("title", TITLES)
+def test_matches_baseline_rules(rules, title, content_type):
+    assert server.mock_streaming_services(title, content_type) == baseline_mock_services(title, content_type)
+
+
+def test_overlapping_keywords_match_every_provider(rules):
+    # "marvel" is a prefix of "marvelous", so the title belongs to both Disney+ and Prime Video
+    services = [service["service"] for service in server.mock_streaming_services("The Marvelous Mrs. Maisel", "tv")]
+    assert services == ["Disney+", "Netflix", "Prime Video", "Hulu"]
+
+
+def test_automaton_agrees_with_substring_search():
+    rng = random.Random(7)
+    keywords = ["he", "she", "his", "hers", "a", "ab", "bab", "abab"]
+    automaton = server.KeywordAutomaton({keyword: {keyword} for keyword in keywords})
+    for length in range(8):
+        for text in ("".join(chars) for chars in itertools.islice(itertools.product("abehirs", repeat=length), 200)):
+            assert automaton.match(text) == {keyword for keyword in keywords if keyword in text}
+    for _ in range(500):
+        text = "".join(rng.choice("abehrs") for _ in range(rng.randint(0, 30)))
+        assert automaton.match(text) == {keyword for keyword in keywords if keyword in text}
+
+
+def test_reloads_after_file_changes(rules):
+    assert server.mock_streaming_services("Paddington 2", "movie")[0]["service"] == "Netflix"
+
+    rewrite(rules, lambda data: data["providers"].append({
+        "offer": {"service": "Peacock", "type": "subscription", "link": "https://peacocktv.com", "quality": "HD", "price": ""},
+        "keywords": ["paddington"],
+    }))
+    assert server.mock_streaming_services("Paddington 2", "movie")[0]["service"] == "Peacock"
+
+
+def test_broken_file_keeps_previous_rules(rules):
+    before = server.mock_streaming_services("Toy Story", "movie")
+    rules.write_text("{not json")
+    stat = os.stat(rules)
+    os.utime(rules, (stat.st_atime, stat.st_mtime + 10))
+    assert server.mock_streaming_services("Toy Story", "movie") == before
+    assert server.streaming_rules.providers